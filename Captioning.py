@@ -1,46 +1,414 @@
-import torch
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForCausalLM
 
-# Model config
+from Metrics import timed, unrecorded
+
+# Model config; torch/transformers are imported on first use so importing this module stays cheap
 _MODEL_ID = "microsoft/Florence-2-large"
-_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-_DTYPE = torch.float16 if torch.cuda.is_available() else torch.float32
+_DEVICE = None
+_DTYPE = None
 
 # Default task prompt (see model card tasks)
 _DEFAULT_PROMPT = "<DETAILED_CAPTION>"
 
-# Generation settings (deterministic by default)
+# Generation settings (deterministic by default); num_beams comes from the profile
 _GEN_KWARGS = dict(
     max_new_tokens=128,   # adjust up to ~256 if you need longer text
     num_beams=3,
     do_sample=False,
 )
 
+# Performance profiles, picked with CAPTION_PROFILE:
+#   dtype     "auto" (fp16 on CUDA, fp32 on CPU) or "bfloat16" (CPU only, if the CPU supports it)
+#   quantize  dynamic int8 quantization of the nn.Linear layers (CPU only)
+#   num_beams 1 = greedy decoding
+# CAPTION_COMPILE=1 additionally torch.compile()s the vision encoder on any profile.
+PROFILES = {
+    "default": dict(dtype="auto", quantize=False, num_beams=3),
+    "greedy": dict(dtype="auto", quantize=False, num_beams=1),
+    "bf16": dict(dtype="bfloat16", quantize=False, num_beams=3),
+    "int8": dict(dtype="auto", quantize=True, num_beams=3),
+    "fast": dict(dtype="auto", quantize=True, num_beams=1),
+    "fast-bf16": dict(dtype="bfloat16", quantize=False, num_beams=1),
+}
+_PROFILE = os.getenv("CAPTION_PROFILE", "default")
+_COMPILE = os.getenv("CAPTION_COMPILE", "0") == "1"
+
+# Upper bound on images per generate() call; override per call with max_batch_size
+_MAX_BATCH_SIZE = int(os.getenv("CAPTION_MAX_BATCH_SIZE", "8"))
+
+# Caption cache defaults (see enable_caption_cache)
+_CACHE_SIZE = int(os.getenv("CAPTION_CACHE_SIZE", "256"))
+_CACHE_MAX_DISTANCE = int(os.getenv("CAPTION_CACHE_MAX_DISTANCE", "4"))
+
 # Lazy singletons
 _model = None
 _processor = None
+_cache = None
+_active_profile = None
+_init_lock = threading.Lock()
+# Held for every generate call and for publishing a (re)loaded model: Florence-2 calls from
+# any thread run one at a time, and a profile swap never pulls the model out from under one
+_generate_lock = threading.Lock()
+
+
+def _cpu_supports_bf16() -> bool:
+    """Native bf16 matmuls (AVX512-BF16 / AMX); elsewhere bf16 is emulated and slower than fp32."""
+    import torch
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        pass
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+
+def _resolve_profile(name: str) -> dict:
+    import torch
+
+    if name not in PROFILES:
+        raise ValueError(f"Unknown CAPTION_PROFILE {name!r}; expected one of {sorted(PROFILES)}")
+    profile = dict(PROFILES[name], name=name, compile=_COMPILE)
+    cuda = torch.cuda.is_available()
+    device = "cuda" if cuda else "cpu"
+
+    dtype = torch.float16 if cuda else torch.float32
+    if profile["dtype"] == "bfloat16" and not cuda:
+        if _cpu_supports_bf16():
+            dtype = torch.bfloat16
+        else:
+            print("⚠️ CPU has no native bfloat16 support, keeping float32")
+    if profile["quantize"] and (cuda or dtype != torch.float32):
+        # Dynamic int8 kernels exist for fp32 CPU modules only
+        print("⚠️ int8 dynamic quantization needs float32 on CPU, skipping it")
+        profile["quantize"] = False
+    profile.update(device=device, torch_dtype=dtype)
+    return profile
+
+
+def _optimize(model, profile):
+    import torch
+
+    if profile["quantize"]:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if profile["compile"]:
+        # Only the vision encoder: its input shape is fixed (768x768), so it compiles once,
+        # while the autoregressive decoder would recompile for every sequence length
+        try:
+            tower = model.vision_tower
+            tower.forward_features_unpool = torch.compile(tower.forward_features_unpool)
+        except Exception as e:
+            print(f"⚠️ torch.compile unavailable, running eagerly: {e}")
+            profile["compile"] = False
+    return model
+
+
+def _is_loaded(profile) -> bool:
+    return _model is not None and (profile is None or _active_profile["name"] == profile)
+
+
+def _lazy_init(profile: str = None):
+    """
+    Load Florence‑2 once, using the official HF API with remote code. Thread-safe.
+    Without a profile any loaded model will do (CAPTION_PROFILE is used to load one);
+    asking for a different profile than the active one replaces the model.
+    """
+    global _model, _processor, _DEVICE, _DTYPE, _active_profile
+    if _is_loaded(profile):
+        return
+    with _init_lock:
+        if _is_loaded(profile):
+            return
+        from transformers import AutoProcessor, AutoModelForCausalLM
+
+        wanted = profile or _PROFILE
+        resolved = _resolve_profile(wanted)
+        model = AutoModelForCausalLM.from_pretrained(
+            _MODEL_ID, torch_dtype=resolved["torch_dtype"], trust_remote_code=True
+        ).to(resolved["device"])
+        model = _optimize(model.eval(), resolved)
+        processor = _processor or AutoProcessor.from_pretrained(_MODEL_ID, trust_remote_code=True)
+        with _generate_lock:
+            _processor = processor
+            _DEVICE, _DTYPE = resolved["device"], resolved["torch_dtype"]
+            _GEN_KWARGS["num_beams"] = resolved["num_beams"]
+            _active_profile = resolved
+            # Publish the model last: other threads check it without the lock
+            _model = model
+        print(f"Florence-2 loaded with profile {wanted!r} ({_DEVICE}, {_DTYPE}, "
+              f"int8={resolved['quantize']}, compiled={resolved['compile']}, beams={resolved['num_beams']})")
+
+
+def load_model(profile: str = None):
+    """
+    Load Florence-2 now instead of on the first predict_captions call, with the given
+    performance profile (default: CAPTION_PROFILE). Cached captions from another
+    profile are dropped.
+    """
+    before = _active_profile["name"] if _active_profile else None
+    _lazy_init(profile)
+    if before not in (None, _active_profile["name"]) and _cache is not None:
+        enable_caption_cache(_cache.max_size, _cache.max_distance)
+
+
+def caption_profile() -> dict:
+    """Settings of the loaded profile, or just the configured name before loading."""
+    if _active_profile is None:
+        return {"name": _PROFILE, "loaded": False}
+    info = {k: v for k, v in _active_profile.items() if k != "torch_dtype"}
+    return dict(info, dtype=str(_active_profile["torch_dtype"]).replace("torch.", ""), loaded=True)
+
+
+def caption_batch_size() -> int:
+    """Images per generate() call (CAPTION_MAX_BATCH_SIZE); the default for predict_captions."""
+    return _MAX_BATCH_SIZE
+
+
+def is_loaded() -> bool:
+    return _model is not None
+
+
+def warm_up():
+    """Caption one blank frame so first-call setup (kernels, allocator) happens off the request path."""
+    # Kept out of the stage metrics: the cold call would skew the measured caption speed
+    # that keyframe_budget turns KEYFRAME_TIME_BUDGET_S into keyframes with
+    with unrecorded():
+        predict_captions([Image.new("RGB", (768, 768))], max_batch_size=1, use_cache=False)
+
+
+class CaptionRecord(str):
+    """
+    A caption plus the object counts detected in its frame.
+
+    It is the rendered string 'text (Detected: person: 3, car: 1)' (plain text when there
+    are no counts), so code that treats captions as strings keeps working; consumers that
+    know about records read .text and .counts instead of parsing the hint back out.
+    """
+
+    def __new__(cls, text: str, counts=None):
+        counts = {str(k): int(v) for k, v in (counts or {}).items() if v}
+        rendered = text
+        if counts:
+            hint = ", ".join(f"{cls_name}: {n}" for cls_name, n in sorted(counts.items()))
+            rendered = f"{text} (Detected: {hint})"
+        record = super().__new__(cls, rendered)
+        record.text = text
+        record.counts = counts
+        return record
+
+
+def _hint_counts(hint) -> dict:
+    """Counts from a legacy extra_info hint: 'person: 3, car: 1' or 'person, person, car'."""
+    counts = {}
+    for item in str(hint).split(","):
+        name, sep, num = item.partition(":")
+        name = name.strip()
+        if not name:
+            continue
+        digits = "".join(ch for ch in num if ch.isdigit()) if sep else ""
+        # Same rule as the old parser: a bare name (or a non-numeric count) counts once
+        counts[name] = max(counts.get(name, 0), int(digits) if digits else 1)
+    return counts
+
+
+def _dhash(img, hash_size: int = 8) -> int:
+    """Difference hash of a downscaled grayscale copy of img as a hash_size**2-bit int."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = np.asarray(small, dtype=np.int16)
+    bits = px[:, 1:] > px[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
 
 
-def _lazy_init():
-    """Load Florence‑2 once, using the official HF API with remote code."""
-    global _model, _processor
-    if _model is None:
-        _model = AutoModelForCausalLM.from_pretrained(
-            _MODEL_ID, torch_dtype=_DTYPE, trust_remote_code=True
-        ).to(_DEVICE)
-        _processor = AutoProcessor.from_pretrained(
-            _MODEL_ID, trust_remote_code=True
+class CaptionCache:
+    """
+    LRU cache of generated captions keyed by (prompt, dHash of the frame).
+
+    A lookup also matches cached frames of the same prompt whose hash differs by at
+    most max_distance bits, so near-identical camera frames share one caption.
+    Captions are stored without the '(Detected: ...)' hint.
+    """
+
+    def __init__(self, max_size: int = _CACHE_SIZE, max_distance: int = _CACHE_MAX_DISTANCE):
+        self.max_size = max(1, int(max_size))
+        self.max_distance = max(0, int(max_distance))
+        self._entries = OrderedDict()  # (prompt, hash) -> caption
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Running mean of generate() time per image, used to estimate time saved by hits
+        self._seconds_per_image = 0.0
+        self._generated = 0
+        self.saved_seconds = 0.0
+
+    def get(self, prompt, frame_hash):
+        with self._lock:
+            key = (prompt, frame_hash)
+            if key not in self._entries and self.max_distance:
+                best = None
+                for p, h in self._entries:
+                    if p != prompt:
+                        continue
+                    dist = (h ^ frame_hash).bit_count()
+                    if dist <= self.max_distance and (best is None or dist < best[0]):
+                        best = (dist, (p, h))
+                if best is not None:
+                    key = best[1]
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += self._seconds_per_image
+                return self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, prompt, frame_hash, caption):
+        with self._lock:
+            key = (prompt, frame_hash)
+            self._entries[key] = caption
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_generation(self, seconds: float, n_images: int):
+        with self._lock:
+            total = self._seconds_per_image * self._generated + seconds
+            self._generated += n_images
+            self._seconds_per_image = total / self._generated
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "seconds_per_caption": round(self._seconds_per_image, 4),
+                "estimated_seconds_saved": round(self.saved_seconds, 2),
+            }
+
+
+def enable_caption_cache(max_size: int = _CACHE_SIZE, max_distance: int = _CACHE_MAX_DISTANCE) -> CaptionCache:
+    """Turn on the module-wide caption cache used by predict_captions."""
+    global _cache
+    _cache = CaptionCache(max_size=max_size, max_distance=max_distance)
+    return _cache
+
+
+def disable_caption_cache():
+    global _cache
+    _cache = None
+
+
+def caption_cache_stats() -> dict:
+    """Hit/miss counters of the caption cache, or {'enabled': False}."""
+    return _cache.stats() if _cache is not None else {"enabled": False}
+
+
+def _is_oom(err: BaseException) -> bool:
+    """True for CUDA / CPU allocator out-of-memory errors."""
+    import torch
+
+    if isinstance(err, torch.cuda.OutOfMemoryError):
+        return True
+    msg = str(err).lower()
+    return "out of memory" in msg or "can't allocate memory" in msg
+
+
+def _generate_batch(images, prompt):
+    """Preprocess a list of RGB images into one pixel_values tensor and generate once."""
+    n = len(images)
+    with timed("caption_preprocess", items=n):
+        inputs = _processor(
+            text=[prompt] * n, images=list(images), return_tensors="pt", padding=True
+        ).to(_DEVICE, _DTYPE)
+
+    with timed("generate", items=n):
+        gen_ids = _model.generate(
+            input_ids=inputs["input_ids"],
+            pixel_values=inputs["pixel_values"],
+            **_GEN_KWARGS,
         )
 
+    # Decode + postprocess per the model card, one output per image
+    with timed("caption_postprocess", items=n):
+        gen_texts = _processor.batch_decode(gen_ids, skip_special_tokens=False)
+        captions = []
+        for gen_text, img in zip(gen_texts, images):
+            parsed = _processor.post_process_generation(
+                gen_text, task=prompt, image_size=(img.width, img.height)
+            )
+            # For caption tasks, parsed has {'<CAPTION>': '...'} or similar
+            cap = parsed.get(prompt, parsed) if isinstance(parsed, dict) else parsed
+            if isinstance(cap, (list, tuple)):
+                cap = cap[0] if cap else ""
+            captions.append(str(cap).strip())
+    return captions
+
+
+def _generate_with_fallback(images, prompt, batch_size):
+    """
+    Caption images in chunks of at most batch_size. On OOM the chunk size is halved
+    and the failed chunk retried; only a failure at batch size 1 is re-raised.
+    """
+    import torch
+
+    captions = []
+    start = 0
+    while start < len(images):
+        chunk = images[start:start + batch_size]
+        try:
+            captions.extend(_generate_batch(chunk, prompt))
+        except RuntimeError as e:
+            if batch_size == 1 or not _is_oom(e):
+                raise
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            batch_size = max(1, batch_size // 2)
+            print(f"⚠️ Out of memory while captioning, retrying with batch size {batch_size}")
+            continue
+        start += len(chunk)
+    return captions
+
 
-@torch.inference_mode()
-def predict_captions(images, extra_info=None, prompt=_DEFAULT_PROMPT):
+def _generate(images, prompt, batch_size):
+    import torch
+
+    with _generate_lock, torch.inference_mode():
+        return _generate_with_fallback(images, prompt, batch_size)
+
+
+def predict_captions(images, extra_info=None, prompt=_DEFAULT_PROMPT, max_batch_size=None, use_cache=True,
+                     detections=None):
     """
-    Accepts a list of PIL.Image objects, returns a list[str] of captions.
-    If extra_info is provided (e.g., "person: 3, car: 1"), it appends it as '(Detected: ...)'.
+    Accepts a list of PIL.Image objects, returns a list of CaptionRecord (str subclass) captions.
+    detections gives the object counts per image (a Counter/dict each, or one for all);
+    they are kept on the record and rendered as '(Detected: ...)'. The older extra_info
+    strings (e.g., "person: 3, car: 1") are still accepted and converted to counts.
 
     The 'prompt' defaults to '<CAPTION>' but you can pass '<DETAILED_CAPTION>' if you want.
+    Images are captioned in batches of up to max_batch_size (default _MAX_BATCH_SIZE)
+    with a single generate() call per batch. When the caption cache is enabled
+    (enable_caption_cache) near-identical frames reuse earlier captions unless use_cache=False.
     """
     if not images:
         return []
@@ -51,43 +419,38 @@ def predict_captions(images, extra_info=None, prompt=_DEFAULT_PROMPT):
     if not isinstance(images, (list, tuple)):
         images = [images]
 
-    if extra_info is not None and not isinstance(extra_info, (list, tuple)):
-        extra_info = [str(extra_info)] * len(images)
+    if detections is None and extra_info:
+        if not isinstance(extra_info, (list, tuple)):
+            extra_info = [extra_info] * len(images)
+        detections = [_hint_counts(hint) if hint else None for hint in extra_info]
+    elif isinstance(detections, dict):
+        detections = [detections] * len(images)
 
-    outputs = []
-    for idx, img in enumerate(images):
-        # Ensure RGB
-        if getattr(img, "mode", None) != "RGB":
-            img = img.convert("RGB")
-
-        # Preprocess + generate
-        inputs = _processor(text=prompt, images=img, return_tensors="pt").to(_DEVICE, _DTYPE)
-        gen_ids = _model.generate(
-            input_ids=inputs["input_ids"],
-            pixel_values=inputs["pixel_values"],
-            **_GEN_KWARGS,
-        )
-
-        # Decode + postprocess per the model card
-        gen_text = _processor.batch_decode(gen_ids, skip_special_tokens=False)[0]
-        parsed = _processor.post_process_generation(
-            gen_text, task=prompt, image_size=(img.width, img.height)
-        )
-        # For caption tasks, parsed has {'<CAPTION>': '...'} or similar
-        cap = parsed.get(prompt, parsed) if isinstance(parsed, dict) else parsed
-        if isinstance(cap, (list, tuple)):
-            cap = cap[0] if cap else ""
-        cap = str(cap).strip()
+    # Ensure RGB
+    images = [img if getattr(img, "mode", None) == "RGB" else img.convert("RGB") for img in images]
 
-        # Append detected-object hint if provided
-        if extra_info:
-            hint = extra_info[idx] if idx < len(extra_info) else ""
-            if hint:
-                cap = f"{cap} (Detected: {hint})"
+    batch_size = max(1, int(max_batch_size or _MAX_BATCH_SIZE))
+    cache = _cache if use_cache else None
 
-        outputs.append(cap)
+    if cache is None:
+        captions = _generate(images, prompt, batch_size)
+    else:
+        hashes = [_dhash(img) for img in images]
+        captions = [cache.get(prompt, h) for h in hashes]
+        missing = [i for i, cap in enumerate(captions) if cap is None]
+        if missing:
+            t0 = time.perf_counter()
+            generated = _generate([images[i] for i in missing], prompt, batch_size)
+            cache.record_generation(time.perf_counter() - t0, len(missing))
+            for i, cap in zip(missing, generated):
+                captions[i] = cap
+                cache.put(prompt, hashes[i], cap)
 
-    return outputs
+    detections = detections or ()
+    return [
+        CaptionRecord(cap, detections[idx] if idx < len(detections) else None)
+        for idx, cap in enumerate(captions)
+    ]
 
 
 def predict_from_paths(image_paths, prompt=_DEFAULT_PROMPT):
@@ -0,0 +1,308 @@
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from Metrics import timed
+
+
+class Frame(NamedTuple):
+    image: np.ndarray   # BGR frame
+    index: int          # sequence number of the frame at the source (counts dropped frames too)
+    timestamp: float    # time.time() right after the frame was grabbed
+
+    @property
+    def age(self) -> float:
+        """Seconds since the frame was captured."""
+        return time.time() - self.timestamp
+
+
+class FrameSource:
+    """
+    Background-grabbed frame source.
+
+    A daemon thread reads frames as fast as the source delivers them and keeps only the
+    newest one; read() hands that frame out once. A consumer slower than the source
+    therefore always gets a fresh frame instead of draining a backlog, and frames it
+    never saw are counted in `dropped`. With latest_only=False the grabber waits for
+    each frame to be taken instead (nothing dropped, e.g. for offline file processing).
+
+    Subclasses implement _open(), _grab() -> (ok, image) and _close().
+    """
+
+    name = "source"
+    # Sources that end (files) stop at the first failed read instead of retrying
+    finite = False
+
+    def __init__(self, latest_only: bool = True):
+        self.latest_only = latest_only
+        self.frames_captured = 0
+        self.dropped = 0
+        self.read_failures = 0
+        self.ended = False
+        self._latest: Optional[Frame] = None
+        self._taken = True
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_age = None
+
+    # -- subclass hooks -------------------------------------------------------------
+    def _open(self) -> bool:
+        return True
+
+    def _grab(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _on_failure(self) -> bool:
+        """Called after a failed grab; return False to end the source."""
+        time.sleep(0.05)
+        return True
+
+    # -- lifecycle ------------------------------------------------------------------
+    def start(self) -> "FrameSource":
+        if self._thread is not None:
+            return self
+        if not self._open():
+            self._close()
+            raise IOError(f"Cannot open frame source: {self.name}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"grab-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        self._close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self.ended
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                with timed("decode"):
+                    ok, image = self._grab()
+                if not ok or image is None:
+                    self.read_failures += 1
+                    if self.finite or not self._on_failure():
+                        break
+                    continue
+
+                frame = Frame(image, self.frames_captured, time.time())
+                self.frames_captured += 1
+                with self._cond:
+                    if not self._taken:
+                        self.dropped += 1
+                    self._latest, self._taken = frame, False
+                    self._cond.notify_all()
+                    if not self.latest_only:
+                        self._cond.wait_for(lambda: self._taken or self._stop.is_set())
+        finally:
+            with self._cond:
+                self.ended = True
+                self._cond.notify_all()
+
+    def read(self, timeout: float = 1.0) -> Optional[Frame]:
+        """
+        The newest frame not handed out yet, waiting up to timeout seconds for one.
+        Returns None on timeout or once the source has ended.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._taken or self.ended or self._stop.is_set(), timeout)
+            if self._taken:
+                return None
+            self._taken = True
+            self._cond.notify_all()
+            frame = self._latest
+        self._last_age = frame.age
+        return frame
+
+    def stats(self) -> dict:
+        return {
+            "source": self.name,
+            "frames_captured": self.frames_captured,
+            "dropped": self.dropped,
+            "read_failures": self.read_failures,
+            "last_frame_age_ms": None if self._last_age is None else round(self._last_age * 1000, 1),
+            "ended": self.ended,
+        }
+
+
+class CaptureSource(FrameSource):
+    """cv2.VideoCapture over a device index, file path or stream URL."""
+
+    def __init__(self, target, latest_only: bool = True):
+        super().__init__(latest_only)
+        self.target = target
+        self.name = str(target)
+        self.cap = None
+
+    def _open(self) -> bool:
+        self.cap = cv2.VideoCapture(self.target)
+        if self.cap.isOpened():
+            # Keep the driver's own queue short; the grabber thread already drops stale frames
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return self.cap.isOpened()
+
+    def _grab(self):
+        return self.cap.read()
+
+    def _close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    @property
+    def fps(self) -> float:
+        return float(self.cap.get(cv2.CAP_PROP_FPS) or 0.0) if self.cap is not None else 0.0
+
+
+class DeviceSource(CaptureSource):
+    """Local camera by index."""
+
+    def __init__(self, index: int = 0, latest_only: bool = True):
+        super().__init__(int(index), latest_only)
+        self.name = f"device:{index}"
+
+
+class FileSource(CaptureSource):
+    """
+    Video file. realtime=True plays it at its native frame rate like a camera (with
+    stale-frame dropping); realtime=False hands out every frame as fast as it is read.
+    """
+
+    finite = True
+
+    def __init__(self, path: str, realtime: bool = True):
+        super().__init__(path, latest_only=realtime)
+        self.name = f"file:{os.path.basename(path)}"
+        self.realtime = realtime
+        self._next_at = None
+
+    def _grab(self):
+        if self.realtime:
+            interval = 1.0 / (self.fps or 30.0)
+            now = time.perf_counter()
+            if self._next_at is not None and self._next_at > now:
+                time.sleep(self._next_at - now)
+            self._next_at = max(now, self._next_at or now) + interval
+        return self.cap.read()
+
+
+class URLSource(CaptureSource):
+    """RTSP/HTTP stream; reconnects after repeated read failures."""
+
+    def __init__(self, url: str, reconnect_after: int = 30, latest_only: bool = True):
+        super().__init__(url, latest_only)
+        self.reconnect_after = reconnect_after
+        self.reconnects = 0
+        self._failures_in_row = 0
+
+    def _grab(self):
+        ok, image = self.cap.read()
+        self._failures_in_row = 0 if ok else self._failures_in_row + 1
+        return ok, image
+
+    def _on_failure(self) -> bool:
+        if self._failures_in_row >= self.reconnect_after:
+            self._close()
+            time.sleep(1.0)
+            self._open()
+            self.reconnects += 1
+            self._failures_in_row = 0
+        else:
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        return dict(super().stats(), reconnects=self.reconnects)
+
+
+class SyntheticSource(FrameSource):
+    """Moving test pattern at a fixed frame rate; no hardware needed (tests, demos, benchmarks)."""
+
+    name = "synthetic"
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30.0, latest_only: bool = True):
+        super().__init__(latest_only)
+        self.width, self.height, self.fps = width, height, fps
+        self._n = 0
+        self._next_at = None
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        self._base = np.zeros((height, width, 3), dtype=np.uint8)
+        self._base[..., 0] = gradient[None, :]
+        self._base[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+
+    def _grab(self):
+        now = time.perf_counter()
+        if self._next_at is not None and self._next_at > now:
+            time.sleep(self._next_at - now)
+        self._next_at = max(now, self._next_at or now) + 1.0 / self.fps
+
+        image = self._base.copy()
+        image[..., 2] = (self._n * 4) % 256
+        x = (self._n * 8) % max(1, self.width - 80)
+        cv2.rectangle(image, (x, self.height // 3), (x + 80, self.height // 3 + 80), (255, 255, 255), -1)
+        cv2.putText(image, f"{self._n}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2, cv2.LINE_AA)
+        self._n += 1
+        return True, image
+
+
+def find_working_camera(max_indexes: int = 5) -> Optional[int]:
+    """Index of the first camera that opens and returns a frame, or None."""
+    print("Searching for available cameras...")
+    for index in range(max_indexes):
+        cap = cv2.VideoCapture(index)
+        try:
+            if cap.isOpened():
+                ret, _ = cap.read()
+                if ret:
+                    print(f"✅ Camera found at index {index}")
+                    return index
+        finally:
+            cap.release()
+    print("❌ No working camera found")
+    return None
+
+
+def open_source(spec=None, **kwargs) -> FrameSource:
+    """
+    Build a (not yet started) FrameSource from a spec:
+      None / "auto"         first working local camera
+      0, "1", ...           local camera index
+      "synthetic"           moving test pattern
+      "rtsp://…", "http…"   network stream
+      anything else         video file path
+    """
+    if spec is None or spec == "auto":
+        index = find_working_camera()
+        if index is None:
+            raise IOError("❌ No working camera found. Try plugging in a different webcam.")
+        return DeviceSource(index, **kwargs)
+    if isinstance(spec, int) or str(spec).isdigit():
+        return DeviceSource(int(spec), **kwargs)
+    spec = str(spec)
+    if spec in ("synthetic", "test"):
+        return SyntheticSource(**kwargs)
+    if spec.split("://", 1)[0].lower() in ("rtsp", "rtmp", "http", "https", "udp", "tcp"):
+        return URLSource(spec, **kwargs)
+    return FileSource(spec, **kwargs)
@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from Metrics import add_request_timing, current_request_timings, observe, request_timings
+
+
+class QueueFull(RuntimeError):
+    """Raised by InferenceExecutor.try_run when no slot is free."""
+
+
+class InferenceExecutor:
+    """
+    Thread pool for blocking model calls (YOLO, Florence-2, LLM) that async handlers await.
+
+    At most max_pending jobs are queued or running at once. run() waits for a slot,
+    try_run() raises QueueFull instead so a live loop can drop work rather than fall behind.
+    PyTorch releases the GIL during inference, so threads are enough to keep the
+    event loop responsive while the lazily-loaded model singletons stay shared.
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_pending: int = 4):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(1, max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._waiters = deque()
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _submit(self, fn, args, kwargs) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        # Copy the caller's context so per-request state (Metrics.request_timings) follows the job
+        ctx = contextvars.copy_context()
+        job = self._pool.submit(ctx.run, fn, *args, **kwargs)
+        # Count the slot free when the pool job finishes, not when the awaiting task does:
+        # a cancelled caller (disconnect, wait_for timeout) leaves the job running
+        job.add_done_callback(lambda _job: self._release(loop))
+        return asyncio.wrap_future(job, loop=loop)
+
+    def _release(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._on_done)
+        except RuntimeError:
+            pass  # loop already closed (shutdown)
+
+    def _on_done(self):
+        self._pending -= 1
+        self.completed += 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool once a slot is free and return its result."""
+        while self._pending >= self.max_pending:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        return await self._submit(fn, args, kwargs)
+
+    def try_run(self, fn, *args, **kwargs) -> asyncio.Future:
+        """Schedule fn without waiting; raises QueueFull if max_pending jobs are in flight."""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise QueueFull(f"{self.name} executor is full ({self.max_pending} pending)")
+        return self._submit(fn, args, kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _CaptionRequest:
+    __slots__ = ("images", "detections", "key", "future", "enqueued", "timings")
+
+    def __init__(self, images, detections, key, timings):
+        self.images = images
+        self.detections = detections
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.timings = timings
+
+
+class CaptionScheduler:
+    """
+    Dynamic batching of caption requests from every caller (live cameras, image
+    uploads, video jobs) into shared Florence-2 calls.
+
+    Requests queue up and a single worker thread takes them in arrival order, batching
+    as many as fit in max_batch_size images. A batch goes out as soon as it is full or
+    once its oldest request has waited max_wait_ms, so a lone request pays at most that
+    delay while concurrent callers share one generate() call. Requests with a different
+    prompt or cache setting wait for their own batch. A request is never split: one
+    bigger than max_batch_size runs alone (predict_captions sub-batches it).
+
+    submit() returns a concurrent.futures.Future of the captions for that request's
+    images; caption() awaits it from async code and predict() blocks on it from
+    threads. With drop_if_full=True submit() raises QueueFull once max_queue images are
+    waiting, so a live loop drops frames instead of growing the backlog.
+    """
+
+    def __init__(self, caption_fn=None, max_batch_size: int = 8, max_wait_ms: float = 20.0,
+                 max_queue: int = 32, name: str = "caption"):
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue = max(1, int(max_queue))
+        self._caption_fn = caption_fn
+        self._queue = deque()
+        self._queued_images = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.batches = 0
+        self.requests = 0
+        self.images = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batch_sizes = Counter()
+        self._wait_total = 0.0
+        self._served = 0
+
+    def _caption(self, images, **kwargs):
+        if self._caption_fn is None:
+            from Captioning import predict_captions
+
+            self._caption_fn = predict_captions
+        return self._caption_fn(images, **kwargs)
+
+    # -- submitting -------------------------------------------------------------------
+    def submit(self, images, detections=None, prompt: str = None, use_cache: bool = True,
+               drop_if_full: bool = False) -> Future:
+        """Queue images (with optional per-image detection counts) for captioning."""
+        images = list(images)
+        if detections is not None and not isinstance(detections, (list, tuple)):
+            detections = [detections] * len(images)
+        request = _CaptionRequest(images, detections, (prompt, use_cache), current_request_timings())
+        if not images:
+            request.future.set_result([])
+            return request.future
+
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} scheduler is shut down")
+            if drop_if_full and self._queued_images + len(images) > self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self.name} scheduler is full ({self._queued_images} images queued)")
+            self._queue.append(request)
+            self._queued_images += len(images)
+            self.requests += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return request.future
+
+    async def caption(self, images, detections=None, **kwargs):
+        return await asyncio.wrap_future(self.submit(images, detections, **kwargs))
+
+    def predict(self, images, detections=None, **kwargs):
+        """Blocking drop-in for predict_captions(images, detections=...) on worker threads."""
+        return self.submit(images, detections, **kwargs).result()
+
+    # -- batching ---------------------------------------------------------------------
+    def _next_batch(self):
+        """Wait for a full batch or the oldest request's deadline; None once shut down and drained."""
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            deadline = self._queue[0].enqueued + self.max_wait
+            while not self._stopped:
+                key = self._queue[0].key
+                ready = sum(len(r.images) for r in self._queue if r.key == key)
+                remaining = deadline - time.perf_counter()
+                if ready >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            first = self._queue.popleft()
+            batch, size = [first], len(first.images)
+            rest = deque()
+            while self._queue:
+                request = self._queue.popleft()
+                if request.key == first.key and size + len(request.images) <= self.max_batch_size:
+                    batch.append(request)
+                    size += len(request.images)
+                else:
+                    rest.append(request)
+            self._queue = rest
+            self._queued_images -= size
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        """Caption one batch; any failure fails its unresolved futures, never the worker thread."""
+        # Callers may have given up (e.g. a cancelled camera task); don't caption for them
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self._caption_batch(batch)
+        except BaseException as e:
+            self.failed += 1
+            for r in batch:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def _caption_batch(self, batch):
+        started = time.perf_counter()
+        images = [img for r in batch for img in r.images]
+        detections = None
+        if any(r.detections is not None for r in batch):
+            detections = [d for r in batch for d in (r.detections or [None] * len(r.images))]
+        prompt, use_cache = batch[0].key
+        kwargs = {"detections": detections, "use_cache": use_cache}
+        if prompt is not None:
+            kwargs["prompt"] = prompt
+
+        for r in batch:
+            wait = started - r.enqueued
+            self._wait_total += wait
+            self._served += 1
+            observe("caption_queue", wait, len(r.images))
+            add_request_timing(r.timings, "caption_queue", wait, len(r.images))
+
+        self.batches += 1
+        self.images += len(images)
+        self.batch_sizes[len(images)] += 1
+        # Collect the shared call's stages (preprocess, generate, ...) to credit every request
+        with request_timings() as stages:
+            captions = self._caption(images, **kwargs)
+        if len(captions) != len(images):
+            raise RuntimeError(f"{self.name}: got {len(captions)} captions for {len(images)} images")
+
+        elapsed = time.perf_counter() - started
+        offset = 0
+        for r in batch:
+            # The shared call is credited to every request in it
+            add_request_timing(r.timings, "caption_batch", elapsed, len(r.images))
+            for stage, entry in stages.items():
+                add_request_timing(r.timings, stage, entry["seconds"], len(r.images))
+            r.future.set_result(list(captions[offset:offset + len(r.images)]))
+            offset += len(r.images)
+
+    # -- lifecycle / stats ------------------------------------------------------------
+    @property
+    def queue_depth(self) -> int:
+        return self._queued_images
+
+    def stats(self) -> dict:
+        return {
+            "queued_requests": len(self._queue),
+            "queued_images": self._queued_images,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "requests": self.requests,
+            "batches": self.batches,
+            "images": self.images,
+            "mean_batch_size": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_wait_ms": round(self._wait_total / self._served * 1000, 2) if self._served else 0.0,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    def shutdown(self, wait: bool = False):
+        """Stop taking requests; queued ones are still captioned unless wait is False (then cancelled)."""
+        with self._cond:
+            self._stopped = True
+            if not wait:
+                for request in self._queue:
+                    request.future.cancel()
+                self._queue.clear()
+                self._queued_images = 0
+            self._cond.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+
+class Job:
+    """
+    State of one background job; progress is reported as frames processed out of the total.
+
+    Jobs also keep an append-only list of events ({"type", "data"}) that clients can
+    tail: "status", "progress", whatever the job function emits, then "done" or "failed".
+    """
+
+    def __init__(self, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued -> running -> done | failed
+        self.frames_processed = 0
+        self.frames_total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self._last_percent = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+
+    def emit(self, event_type: str, data=None):
+        # list.append is atomic, so workers can emit while readers slice
+        self.events.append({"type": event_type, "data": data})
+
+    def events_since(self, index: int) -> list:
+        return self.events[index:]
+
+    def report_progress(self, frames_processed: int, frames_total: int):
+        self.frames_processed = frames_processed
+        self.frames_total = max(frames_total, frames_processed)
+        # One progress event per whole percent keeps the event log short
+        percent = int(100 * frames_processed / self.frames_total) if self.frames_total else None
+        if percent != self._last_percent or percent is None:
+            self._last_percent = percent
+            self.emit("progress", {"frames_processed": frames_processed, "frames_total": self.frames_total})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        percent = None
+        if self.status == "done":
+            percent = 100.0
+        elif self.frames_total:
+            percent = round(100.0 * self.frames_processed / self.frames_total, 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "frames_processed": self.frames_processed,
+            "frames_total": self.frames_total,
+            "percent": percent,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    FIFO queue of jobs served by a fixed number of worker threads.
+
+    submit(fn, *args) returns a Job immediately; a worker later calls fn(job, *args, **kwargs)
+    and stores its return value in job.result (or the exception text in job.error).
+    Only the newest max_finished finished jobs are kept.
+    """
+
+    def __init__(self, workers: int = 2, max_finished: int = 100):
+        self.workers = max(1, workers)
+        self.max_finished = max_finished
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        job = Job(fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def complete(self, result) -> Job:
+        """Register a job that is already done with result (e.g. served from a cache)."""
+        job = Job(None, (), {})
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        job.emit("done", result)
+        job.status = "done"
+        with self._lock:
+            self._jobs[job.id] = job
+        self._evict()
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        with self._lock:
+            finished = [jid for jid, j in self._jobs.items() if j.finished]
+            for jid in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[jid]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.status = "running"
+            job.started_at = time.time()
+            job.emit("status", {"status": "running"})
+            try:
+                job.result = job._fn(job, *job._args, **job._kwargs)
+                # Emit before flipping status so event readers never stop short of it
+                job.emit("done", job.result)
+                job.status = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.emit("failed", {"error": job.error})
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job._fn = job._args = job._kwargs = None
+                self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": self.workers,
+            "queued": sum(j.status == "queued" for j in jobs),
+            "running": sum(j.status == "running" for j in jobs),
+            "finished": sum(j.finished for j in jobs),
+        }
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
@@ -1,28 +1,244 @@
+import asyncio
+import hashlib
+import math
 import os
+import random
 import re
-from collections import defaultdict
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Union
 
-import cohere
+from Metrics import timed
 
-# Prefer environment variable; fall back to optional init.py for convenience
-_API_ENV = os.getenv("COHERE_API_KEY")
-if not _API_ENV:
-    try:
-        from init import my_key as _API_ENV  # optional legacy fallback
-    except Exception:
-        _API_ENV = None
+# Which summarizer backs useCohere: "cohere", "openai" (any OpenAI-compatible endpoint,
+# e.g. a local server or mock_llm_server.py) or "local" (offline extractive). "auto" uses
+# Cohere when a key is configured and the local summarizer otherwise.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "auto").lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:8001/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "")
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
 
-if not _API_ENV:
-    raise RuntimeError("Cohere API key not found. Set COHERE_API_KEY env var (or provide init.my_key).")
 
-co = cohere.Client(_API_ENV)
+def _cohere_key():
+    # Prefer environment variable; fall back to optional init.py for convenience
+    key = os.getenv("COHERE_API_KEY")
+    if not key:
+        try:
+            from init import my_key as key  # optional legacy fallback
+        except Exception:
+            key = None
+    return key
+
+
+class CohereBackend:
+    name = "cohere"
+
+    def __init__(self, model: str = None):
+        key = _cohere_key()
+        if not key:
+            raise RuntimeError("Cohere API key not found. Set COHERE_API_KEY env var (or provide init.my_key).")
+        import cohere
+
+        self.model = model or "command-r-plus"
+        self.client = cohere.Client(key)
+        self._key = key
+        self._async_client = None
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float = 0.4) -> str:
+        response = self.client.generate(
+            model=self.model, prompt=prompt, max_tokens=max_tokens, temperature=temperature
+        )
+        return response.generations[0].text.strip()
+
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float = 0.4) -> str:
+        if self._async_client is None:
+            import cohere
+
+            self._async_client = cohere.AsyncClient(self._key)
+        response = await self._async_client.generate(
+            model=self.model, prompt=prompt, max_tokens=max_tokens, temperature=temperature
+        )
+        return response.generations[0].text.strip()
+
+
+class OpenAICompatibleBackend:
+    """Chat completions over HTTP against any OpenAI-compatible server (LLM_BASE_URL)."""
+
+    name = "openai"
+
+    def __init__(self, base_url: str = LLM_BASE_URL, model: str = None, api_key: str = None,
+                 timeout: float = LLM_TIMEOUT_S):
+        import httpx
+
+        self.model = model or "local"
+        headers = {}
+        api_key = api_key or os.getenv("LLM_API_KEY")
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        self._client_kwargs = {
+            "base_url": base_url.rstrip("/"),
+            "headers": headers,
+            "timeout": timeout,
+            "limits": httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY),
+        }
+        # One pooled client per process; keep-alive saves a handshake per summary
+        self.client = httpx.Client(**self._client_kwargs)
+        self._async_client = None
+
+    def _body(self, prompt: str, max_tokens: int, temperature: float) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+
+    @staticmethod
+    def _text(response) -> str:
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float = 0.4) -> str:
+        return self._text(self.client.post("/chat/completions", json=self._body(prompt, max_tokens, temperature)))
+
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float = 0.4) -> str:
+        if self._async_client is None:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(**self._client_kwargs)
+        response = await self._async_client.post("/chat/completions", json=self._body(prompt, max_tokens, temperature))
+        return self._text(response)
+
+
+_WORD = re.compile(r"[a-z]+")
+_STOPWORDS = frozenset(
+    "a an the of in on at to and or is are was were be with by for from as it its this that "
+    "there their they he she his her into while over under near image shows picture photo".split()
+)
+
+
+def extractive_summary(texts: List[str], max_tokens: int = 120) -> str:
+    """
+    Offline summary: the most central texts (by shared content words), kept in their
+    original order and trimmed to ~max_tokens. Near-identical texts are only used once.
+    """
+    texts = [t.strip() for t in texts if t.strip()]
+    if not texts:
+        return ""
+    bags = [Counter(w for w in _WORD.findall(t.lower()) if w not in _STOPWORDS) for t in texts]
+    doc_freq = Counter(w for bag in bags for w in bag)
+
+    def score(i):
+        bag = bags[i]
+        return sum(doc_freq[w] for w in bag) / math.sqrt(sum(bag.values()) + 1)
+
+    chosen, used = [], 0
+    for i in sorted(range(len(texts)), key=score, reverse=True):
+        if any(bags[i] and bags[i].keys() <= bags[j].keys() for j in chosen):
+            continue
+        tokens = _estimate_tokens(texts[i])
+        if chosen and used + tokens > max_tokens:
+            break
+        chosen.append(i)
+        used += tokens
+    return " ".join(texts[i].rstrip(".") + "." for i in sorted(chosen))
+
+
+class ExtractiveBackend:
+    """
+    Local summarizer with no model and no network: it summarizes the "- " bullet lines
+    of the prompt extractively. All prompts in this module list their inputs that way.
+    """
+
+    name = "local"
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float = 0.4) -> str:
+        bullets = [line[2:] for line in prompt.splitlines() if line.startswith("- ")]
+        return extractive_summary(bullets, max_tokens) or "No content to summarize."
+
+
+_BACKENDS = {
+    "cohere": CohereBackend,
+    "openai": OpenAICompatibleBackend,
+    "local": ExtractiveBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured backend, created on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = LLM_BACKEND
+                if name == "auto":
+                    name = "cohere" if _cohere_key() else "local"
+                if name not in _BACKENDS:
+                    raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected one of {sorted(_BACKENDS)}")
+                kwargs = {"model": LLM_MODEL} if LLM_MODEL and name != "local" else {}
+                _backend = _BACKENDS[name](**kwargs)
+                print(f"LLM backend: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """Use backend (any object with generate(prompt, max_tokens)) instead of the configured one."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# Hierarchical summarization: captions are split into chunks of roughly this many prompt
+# tokens, chunks are summarized in parallel, then the chunk summaries are summarized
+_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "1500"))
+_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))
+_SUMMARY_CACHE_SIZE = int(os.getenv("LLM_SUMMARY_CACHE_SIZE", "512"))
+
+_map_pool = ThreadPoolExecutor(max_workers=_MAP_CONCURRENCY, thread_name_prefix="llm-map")
+_summary_cache = OrderedDict()
+_summary_cache_lock = threading.Lock()
+
+
+# One pass per caption: the hint group is the text inside "(Detected: ...)"
+_DETECTED = re.compile(r"\s*\(Detected:\s*([^)]*)\)")
 
 
 def _normalize_value_to_list(v: Union[str, List[str]]) -> List[str]:
     if isinstance(v, list):
-        return [str(x) for x in v]
-    return [str(v)]
+        return v
+    return [v]
+
+
+@lru_cache(maxsize=4096)
+def parse_caption(caption: str):
+    """
+    (cleaned text, ((class, count), ...)) from a caption string carrying a trailing
+    "(Detected: person: 3, car)" hint. Memoized: live sessions repeat captions a lot.
+    """
+    m = _DETECTED.search(caption)
+    if not m:
+        return caption.strip(), ()
+
+    cleaned = (caption[:m.start()] + caption[m.end():]).strip()
+    counts = {}
+    for item in m.group(1).split(","):
+        # Allow "person: 3" or just "person"; a non-numeric count is treated as 1
+        cls, sep, cnt = item.partition(":")
+        cls = cls.strip()
+        if not cls:
+            continue
+        digits = "".join(ch for ch in cnt if ch.isdigit()) if sep else ""
+        num = int(digits) if digits else 1
+        if num > counts.get(cls, 0):
+            counts[cls] = num
+    return cleaned, tuple(counts.items())
 
 
 def extract_max_counts_and_cleaned_captions(captions_dict: Dict[Union[int, str], Union[str, List[str]]]):
@@ -31,72 +247,285 @@ def extract_max_counts_and_cleaned_captions(captions_dict: Dict[Union[int, str],
     Extracts:
       - max counts per object class from trailing "(Detected: ...)" patterns
       - cleaned captions with the "(Detected: ...)" segment removed
+
+    Captioning.CaptionRecord values are read from their .text/.counts without any parsing.
     """
     max_counts = defaultdict(int)
     cleaned_captions: List[str] = []
 
     for value in captions_dict.values():
         for caption in _normalize_value_to_list(value):
-            # 1) Clean the caption text
-            cleaned = re.sub(r"\(Detected:.*?\)", "", caption).strip()
+            counts = getattr(caption, "counts", None)
+            if counts is not None:
+                cleaned, items = caption.text.strip(), counts.items()
+            else:
+                cleaned, items = parse_caption(str(caption))
+
             if cleaned:
                 cleaned_captions.append(cleaned)
-
-            # 2) Parse detected classes (robust)
-            m = re.search(r"Detected:\s*(.*)", caption)
-            if not m:
-                continue
-
-            items = [p.strip() for p in m.group(1).split(",") if p.strip()]
-            for item in items:
-                # Allow "person: 3" or just "person"
-                if ":" in item:
-                    cls, cnt = item.split(":", 1)
-                    cls = cls.strip()
-                    try:
-                        num = int(re.sub(r"[^\d]", "", cnt))
-                        if num > max_counts[cls]:
-                            max_counts[cls] = num
-                    except ValueError:
-                        # If the count isn't an int, treat as 1
-                        if 1 > max_counts[cls]:
-                            max_counts[cls] = 1
-                else:
-                    cls = item.strip()
-                    if 1 > max_counts[cls]:
-                        max_counts[cls] = 1
+            for cls, num in items:
+                if num > max_counts[cls]:
+                    max_counts[cls] = num
 
     return dict(max_counts), cleaned_captions
 
 
-def useCohere(captions_dict: Dict[Union[int, str], Union[str, List[str]]]) -> str:
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; good enough for budgeting prompts
+    return len(text) // 4 + 1
+
+
+def chunk_by_tokens(texts: List[str], budget: int = _CHUNK_TOKENS) -> List[List[str]]:
     """
-    Summarize a set of frame captions using Cohere. Values may be a string or a list of strings.
+    Greedily split texts, in order, into chunks of at most ~budget tokens (a single
+    oversized text gets its own chunk). Appending texts only ever changes the last
+    chunk, so summaries of the earlier chunks stay valid.
     """
-    counter, cleaned_captions = extract_max_counts_and_cleaned_captions(captions_dict)
+    chunks, current, used = [], [], 0
+    for text in texts:
+        tokens = _estimate_tokens(text)
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _generate(prompt: str, max_tokens: int) -> str:
+    backend = get_backend()
+    with timed("llm"):
+        return backend.generate(prompt, max_tokens)
+
+
+def _chunk_key(texts: List[str], level: int) -> str:
+    return hashlib.blake2b(f"{level}\n".encode() + "\n".join(texts).encode(), digest_size=16).hexdigest()
+
+
+def _chunk_prompt(texts: List[str], level: int) -> str:
+    what = "consecutive video frames" if level == 0 else "consecutive parts of a video"
+    bullets = "\n".join(f"- {t}" for t in texts)
+    return (
+        f"Summarize the following descriptions of {what} in two or three sentences, "
+        "keeping the order of events.\n\n"
+        f"{bullets}\n\n"
+        "Summary:"
+    )
+
+
+def _cached_summary(key: str):
+    with _summary_cache_lock:
+        summary = _summary_cache.get(key)
+        if summary is not None:
+            _summary_cache.move_to_end(key)
+        return summary
+
+
+def _cache_summary(key: str, summary: str):
+    with _summary_cache_lock:
+        _summary_cache[key] = summary
+        while len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+
+
+def _summarize_chunk(texts: List[str], level: int) -> str:
+    """Summary of one chunk, cached by content so unchanged chunks are never re-sent."""
+    key = _chunk_key(texts, level)
+    summary = _cached_summary(key)
+    if summary is None:
+        summary = _generate(_chunk_prompt(texts, level), max_tokens=120)
+        _cache_summary(key, summary)
+    return summary
 
+
+def _needs_reduce(texts: List[str], budget: int) -> bool:
+    return len(texts) > 1 and _estimate_tokens("\n".join(texts)) > budget
+
+
+def _reduce_to_budget(texts: List[str], budget: int) -> List[str]:
+    """Map-reduce texts until they fit into one prompt of ~budget tokens."""
+    level = 0
+    while _needs_reduce(texts, budget):
+        chunks = chunk_by_tokens(texts, budget)
+        if len(chunks) == len(texts) and level > 0:
+            # Summaries no longer shrink (each one alone exceeds the budget); stop here
+            break
+        texts = list(_map_pool.map(lambda chunk, lvl=level: _summarize_chunk(chunk, lvl), chunks))
+        level += 1
+    return texts
+
+
+def summary_settings() -> dict:
+    """Everything that changes a summary for the same captions; used as a results-store key."""
+    backend = get_backend()
+    return {"backend": backend.name, "model": getattr(backend, "model", None), "chunk_tokens": _CHUNK_TOKENS}
+
+
+def summary_cache_stats() -> dict:
+    return {"entries": len(_summary_cache), "max_entries": _SUMMARY_CACHE_SIZE}
+
+
+def _objects_summary(counter) -> str:
     # Build a compact objects summary string in deterministic order
     if counter:
-        objects_summary = ", ".join(f"{k} ({v})" for k, v in sorted(counter.items()))
+        return ", ".join(f"{k} ({v})" for k, v in sorted(counter.items()))
+    return "none clearly dominant"
+
+
+def _final_prompt(objects_summary: str, parts: List[str], hierarchical: bool) -> str:
+    if hierarchical:
+        intro = "Here are summaries of consecutive parts of the video, in order:\n"
     else:
-        objects_summary = "none clearly dominant"
-
-    bullets = "\n".join(f"- {cap}" for cap in cleaned_captions) if cleaned_captions else "- (no clean captions parsed)"
-
-    response = co.generate(
-        model="command-r-plus",
-        prompt=(
-            "You are a visual understanding assistant. Summarize what is happening in the following video frames.\n"
-            f"Most frequently detected objects: {objects_summary}.\n\n"
-            "Here are descriptions of individual frames:\n"
-            f"{bullets}\n\n"
-            "Provide a short, human-like summary of the overall scene.\n\n"
-            "Final Summary:"
-        ),
-        max_tokens=120,
-        temperature=0.4,
+        intro = "Here are descriptions of individual frames:\n"
+
+    bullets = "\n".join(f"- {p}" for p in parts) if parts else "- (no clean captions parsed)"
+
+    return (
+        "You are a visual understanding assistant. Summarize what is happening in the following video frames.\n"
+        f"Most frequently detected objects: {objects_summary}.\n\n"
+        f"{intro}"
+        f"{bullets}\n\n"
+        "Provide a short, human-like summary of the overall scene.\n\n"
+        "Final Summary:"
     )
-    return response.generations[0].text.strip()
+
+
+def useCohere(captions_dict: Dict[Union[int, str], Union[str, List[str]]]) -> str:
+    """
+    Summarize a set of frame captions with the configured LLM backend (Cohere by default;
+    see LLM_BACKEND). Values may be a string or a list of strings.
+
+    Captions that don't fit into one prompt of LLM_CHUNK_TOKENS are summarized
+    hierarchically: chunk summaries first (in parallel, cached), then the final summary.
+    """
+    counter, cleaned_captions = extract_max_counts_and_cleaned_captions(captions_dict)
+    parts = _reduce_to_budget(cleaned_captions, _CHUNK_TOKENS)
+    prompt = _final_prompt(_objects_summary(counter), parts, parts is not cleaned_captions)
+    return _generate(prompt, max_tokens=120)
+
+
+def _retryable(exc: BaseException) -> bool:
+    # Client errors (bad request, auth) won't succeed on retry; rate limits and 5xx may
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return not isinstance(exc, (ValueError, TypeError))
+
+
+class AsyncLLMClient:
+    """
+    Async front end to the configured backend for event-loop callers.
+
+    - at most max_concurrency calls in flight; the rest wait their turn
+    - each attempt is cut off after timeout seconds
+    - failed attempts are retried with exponential backoff and jitter
+    - concurrent calls with an identical prompt share one request (coalescing), so many
+      viewers of the same camera summarizing at the same moment cost a single call
+
+    Backends with an agenerate() coroutine (pooled async HTTP clients) are awaited
+    directly; others run in a worker thread. Bound to the event loop that first uses it.
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout: float = LLM_TIMEOUT_S, retries: int = None,
+                 backoff: float = 0.5, max_backoff: float = 8.0):
+        self.max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+        self.timeout = timeout
+        self.retries = LLM_RETRIES if retries is None else retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def generate(self, prompt: str, max_tokens: int = 120) -> str:
+        key = (prompt, max_tokens)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._generate_with_retries(prompt, max_tokens))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f, k=key: self._forget(k, f))
+        else:
+            self.coalesced += 1
+        # Shield so one caller giving up doesn't cancel the request for the others
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            future.exception()  # mark retrieved even if every waiter went away
+
+    async def _call(self, prompt: str, max_tokens: int) -> str:
+        backend = get_backend()
+        agenerate = getattr(backend, "agenerate", None)
+        if agenerate is not None:
+            return await agenerate(prompt, max_tokens)
+        return await asyncio.to_thread(backend.generate, prompt, max_tokens)
+
+    async def _generate_with_retries(self, prompt: str, max_tokens: int) -> str:
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    self.calls += 1
+                    with timed("llm"):
+                        return await asyncio.wait_for(self._call(prompt, max_tokens), self.timeout)
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e):
+                    self.failed += 1
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.retried += 1
+                print(f"LLM call failed ({e!r}); retry {attempt + 1}/{self.retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _summarize_chunk(self, texts: List[str], level: int) -> str:
+        key = _chunk_key(texts, level)
+        summary = _cached_summary(key)
+        if summary is None:
+            summary = await self.generate(_chunk_prompt(texts, level), max_tokens=120)
+            _cache_summary(key, summary)
+        return summary
+
+    async def summarize(self, captions_dict: Dict[Union[int, str], Union[str, List[str]]]) -> str:
+        """Async useCohere: same prompts and chunk cache, chunk summaries requested concurrently."""
+        counter, cleaned_captions = extract_max_counts_and_cleaned_captions(captions_dict)
+        parts, level = cleaned_captions, 0
+        while _needs_reduce(parts, _CHUNK_TOKENS):
+            chunks = chunk_by_tokens(parts, _CHUNK_TOKENS)
+            if len(chunks) == len(parts) and level > 0:
+                break
+            parts = list(await asyncio.gather(*(self._summarize_chunk(c, level) for c in chunks)))
+            level += 1
+        prompt = _final_prompt(_objects_summary(counter), parts, parts is not cleaned_captions)
+        return await self.generate(prompt, max_tokens=120)
+
+    def stats(self) -> dict:
+        return {
+            "backend": LLM_BACKEND if _backend is None else _backend.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+_async_client = None
+
+
+def get_async_client() -> AsyncLLMClient:
+    """Shared AsyncLLMClient, created on first use (from inside the event loop)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncLLMClient()
+    return _async_client
 
 
 
@@ -0,0 +1,200 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) shared by all stage histograms
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_registry = []
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_recording = contextvars.ContextVar("metrics_recording", default=True)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _fmt(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._series = {}
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current count for these labels (0 if never incremented)."""
+        with _lock:
+            return self._series.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_label_str(key)} {_fmt(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self._series[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_label_str(key)} {_fmt(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def totals(self, **labels):
+        """(sum, count) of the values observed for these labels."""
+        with _lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def mean(self, **labels):
+        """Mean observed value for these labels, or None if nothing was observed."""
+        total, count = self.totals(**labels)
+        return total / count if count else None
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', _fmt(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_str(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Wall time spent per pipeline stage call")
+STAGE_ITEMS = Counter("pipeline_stage_items_total", "Items (frames, images, prompts) processed per stage")
+STAGE_ERRORS = Counter("pipeline_stage_errors_total", "Stage calls that raised an exception")
+
+
+def observe(stage: str, seconds: float, items: int = 1):
+    """Record one call of stage globally and in the active request's timings."""
+    if not _recording.get():
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    STAGE_ITEMS.inc(items, stage=stage)
+    add_request_timing(_request_timings.get(), stage, seconds, items)
+
+
+def current_request_timings():
+    """The active request_timings() dict (or None), to credit work done later on another thread."""
+    return _request_timings.get()
+
+
+def add_request_timing(timings, stage: str, seconds: float, items: int = 1):
+    """Add one stage call to a request_timings() dict only, not to the global metrics."""
+    if timings is None:
+        return
+    with _lock:
+        entry = timings.setdefault(stage, {"seconds": 0.0, "calls": 0, "items": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["items"] += items
+
+
+@contextmanager
+def timed(stage: str, items: int = 1):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - t0, items)
+
+
+@contextmanager
+def unrecorded():
+    """Stage timings inside this block are not recorded (e.g. cold warm-up calls)."""
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+
+@contextmanager
+def request_timings():
+    """
+    Collect per-stage timings for the code run inside this block (including work
+    submitted through Inference.InferenceExecutor, which copies the context).
+    Yields a dict {stage: {"seconds", "calls", "items"}}.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+        with _lock:
+            for entry in timings.values():
+                entry["seconds"] = round(entry["seconds"], 4)
+
+
+def stage_seconds_per_item(stage: str):
+    """Average seconds per processed item (frame, image) of stage so far, or None."""
+    seconds, _ = STAGE_SECONDS.totals(stage=stage)
+    items = STAGE_ITEMS.value(stage=stage)
+    return seconds / items if items else None
+
+
+def render_prometheus() -> str:
+    with _lock:
+        lines = [line for metric in _registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
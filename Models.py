@@ -0,0 +1,78 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+
+
+class ModelState:
+    """Lifecycle of one model: pending -> loading -> warming -> ready, or failed."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+
+class ModelManager:
+    """
+    Loads registered models in parallel worker threads, then runs each one's warm-up.
+
+    register(name, load, warm_up) adds a model; load_all() loads and warms every model
+    concurrently and never raises: failures are recorded in the model's state, and the
+    model's own lazy loading still applies on the next request.
+    """
+
+    def __init__(self):
+        self._models = OrderedDict()
+        self.states = OrderedDict()
+
+    def register(self, name: str, load, warm_up=None):
+        self._models[name] = (load, warm_up)
+        self.states[name] = ModelState(name)
+
+    async def _load(self, name: str):
+        load, warm_up = self._models[name]
+        state = self.states[name]
+        try:
+            state.status = "loading"
+            t0 = time.perf_counter()
+            await asyncio.to_thread(load)
+            state.load_seconds = round(time.perf_counter() - t0, 3)
+
+            if warm_up is not None:
+                state.status = "warming"
+                t0 = time.perf_counter()
+                await asyncio.to_thread(warm_up)
+                state.warmup_seconds = round(time.perf_counter() - t0, 3)
+
+            state.status = "ready"
+            print(f"✅ {name} ready (load {state.load_seconds}s, warm-up {state.warmup_seconds}s)")
+        except Exception as e:
+            traceback.print_exc()
+            state.status = "failed"
+            state.error = str(e)
+            print(f"⚠️ {name} failed to load: {e}")
+
+    async def load_all(self):
+        await asyncio.gather(*(self._load(name) for name in self._models))
+
+    @property
+    def ready(self) -> bool:
+        return all(state.ready for state in self.states.values())
+
+    def status(self) -> dict:
+        return {name: state.to_dict() for name, state in self.states.items()}
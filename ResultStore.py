@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from Captioning import CaptionRecord
+
+RESULTS_DB = os.getenv("RESULTS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "results.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_hash  TEXT PRIMARY KEY,
+    filename    TEXT,
+    size        INTEGER,
+    frame_count INTEGER,
+    fps         REAL,
+    created_at  REAL
+);
+CREATE TABLE IF NOT EXISTS caption_runs (
+    video_hash   TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    settings     TEXT NOT NULL,
+    scenes       TEXT NOT NULL,
+    created_at   REAL,
+    PRIMARY KEY (video_hash, settings_key)
+);
+CREATE TABLE IF NOT EXISTS captions (
+    video_hash   TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    frame_idx    INTEGER NOT NULL,
+    text         TEXT NOT NULL,
+    counts       TEXT NOT NULL,
+    PRIMARY KEY (video_hash, settings_key, frame_idx)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    video_hash   TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    summary_key  TEXT NOT NULL,
+    settings     TEXT NOT NULL,
+    summary      TEXT NOT NULL,
+    created_at   REAL,
+    PRIMARY KEY (video_hash, settings_key, summary_key)
+);
+CREATE TABLE IF NOT EXISTS live_summaries (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    source        TEXT,
+    minute        TEXT,
+    summary       TEXT NOT NULL,
+    caption_count INTEGER,
+    captions      TEXT,
+    created_at    REAL
+);
+"""
+
+
+def content_hasher():
+    """Incremental hash for uploads: feed chunks with update(), key with hexdigest()."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = content_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def settings_key(settings: dict) -> str:
+    """Stable key for a settings dict (order-independent)."""
+    blob = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+def _caption_parts(caption):
+    counts = getattr(caption, "counts", None) or {}
+    text = getattr(caption, "text", None)
+    return (text if text is not None else str(caption)), counts
+
+
+class ResultStore:
+    """
+    SQLite store of processed videos keyed by content hash.
+
+    Captions (with detection counts) and scene cuts are stored per caption-settings key,
+    summaries per (caption settings, summary settings) pair, so changing only the
+    summarizer reuses the stored captions. Live sessions append their per-minute
+    summaries. One connection shared across threads behind a lock; WAL keeps readers
+    from blocking the writer in other processes.
+    """
+
+    def __init__(self, path: str = RESULTS_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def put_video(self, video_hash: str, filename: str = None, size: int = None, frame_count: int = None,
+                  fps: float = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+                (video_hash, filename, size, frame_count, fps, time.time()),
+            )
+
+    def get_video(self, video_hash: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, size, frame_count, fps, created_at FROM videos WHERE video_hash = ?",
+                (video_hash,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("filename", "size", "frame_count", "fps", "created_at"), row))
+
+    def put_captions(self, video_hash: str, settings: dict, scenes, captions: dict):
+        key = settings_key(settings)
+        rows = []
+        for frame_idx, caption in captions.items():
+            text, counts = _caption_parts(caption)
+            rows.append((video_hash, key, int(frame_idx), text, json.dumps(counts)))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM captions WHERE video_hash = ? AND settings_key = ?", (video_hash, key))
+            self._conn.executemany("INSERT INTO captions VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO caption_runs VALUES (?, ?, ?, ?, ?)",
+                (video_hash, key, json.dumps(settings, sort_keys=True, default=str),
+                 json.dumps([int(s) for s in scenes]), time.time()),
+            )
+
+    def get_captions(self, video_hash: str, settings: dict):
+        """(scenes, {frame_idx: CaptionRecord}) stored for these settings, or None."""
+        key = settings_key(settings)
+        with self._lock:
+            run = self._conn.execute(
+                "SELECT scenes FROM caption_runs WHERE video_hash = ? AND settings_key = ?", (video_hash, key)
+            ).fetchone()
+            rows = [] if run is None else self._conn.execute(
+                "SELECT frame_idx, text, counts FROM captions WHERE video_hash = ? AND settings_key = ? "
+                "ORDER BY frame_idx",
+                (video_hash, key),
+            ).fetchall()
+        if run is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        captions = {frame_idx: CaptionRecord(text, json.loads(counts)) for frame_idx, text, counts in rows}
+        return json.loads(run[0]), captions
+
+    def put_summary(self, video_hash: str, settings: dict, summary_settings: dict, summary: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (video_hash, settings_key(settings), settings_key(summary_settings),
+                 json.dumps(summary_settings, sort_keys=True, default=str), summary, time.time()),
+            )
+
+    def get_summary(self, video_hash: str, settings: dict, summary_settings: dict = None):
+        """Stored summary for these settings; with summary_settings=None the latest for the captions."""
+        with self._lock:
+            if summary_settings is None:
+                row = self._conn.execute(
+                    "SELECT summary FROM summaries WHERE video_hash = ? AND settings_key = ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (video_hash, settings_key(settings)),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT summary FROM summaries WHERE video_hash = ? AND settings_key = ? AND summary_key = ?",
+                    (video_hash, settings_key(settings), settings_key(summary_settings)),
+                ).fetchone()
+        return row[0] if row else None
+
+    def add_live_summary(self, summary: str, captions: dict = None, source: str = "live", minute: str = None):
+        captions = captions or {}
+        flat = {str(k): [str(c) for c in (v if isinstance(v, list) else [v])] for k, v in captions.items()}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO live_summaries (source, minute, summary, caption_count, captions, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (source, minute, summary, sum(len(v) for v in flat.values()), json.dumps(flat), time.time()),
+            )
+
+    def live_summaries(self, source: str = None, limit: int = 60) -> list:
+        query = "SELECT source, minute, summary, caption_count, created_at FROM live_summaries"
+        args = ()
+        if source:
+            query += " WHERE source = ?"
+            args = (source,)
+        query += " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, args + (limit,)).fetchall()
+        keys = ("source", "minute", "summary", "caption_count", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            videos = self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            live = self._conn.execute("SELECT COUNT(*) FROM live_summaries").fetchone()[0]
+        return {"path": self.path, "videos": videos, "live_summaries": live, "hits": self.hits,
+                "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,130 @@
+import time
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+
+def box_iou(a, b) -> np.ndarray:
+    """(N, M) IoU between two sets of xyxy boxes."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = np.clip(a[:, 2:] - a[:, :2], 0, None).prod(axis=1)
+    area_b = np.clip(b[:, 2:] - b[:, :2], 0, None).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class ChangeDrivenSampler:
+    """
+    Decides which live frames get captioned, from their YOLO detections alone.
+
+    A frame with detections is sampled when, compared with the last sampled frame:
+      - "counts": the per-class counts changed by count_delta objects or more
+        (a class appearing or leaving counts as its whole count),
+      - "motion": some object has no box of its class left with IoU >= move_iou
+        at its last sampled position, or
+      - "stale": max_staleness seconds passed, so a busy but static scene is still
+        re-described now and then.
+    Frames without detections are never sampled. Once the scene has stayed empty for
+    empty_hold seconds (default min_interval) the comparison state is cleared, so objects
+    that leave and come back count as a change; a shorter gap is treated as detection
+    flicker and forgotten. Samples are at least min_interval seconds apart, so flicker
+    does not turn into bursts of caption calls either.
+    Frames with detections that are not sampled are counted as skipped calls.
+    """
+
+    def __init__(self, count_delta: int = 1, move_iou: float = 0.5, max_staleness: float = 10.0,
+                 min_interval: float = 1.0, empty_hold: float = None):
+        self.count_delta = max(1, int(count_delta))
+        self.move_iou = move_iou
+        self.max_staleness = max_staleness
+        self.min_interval = min_interval
+        self.empty_hold = min_interval if empty_hold is None else empty_hold
+        self.frames = 0
+        self.sampled = 0
+        self.skipped = 0
+        self.triggers = Counter()
+        self._last_at = None
+        self._last_counts = Counter()
+        self._last_boxes = {}  # class name -> (N, 4) boxes at the last sample
+        self._empty_since = None
+
+    @staticmethod
+    def _group_boxes(names, boxes) -> dict:
+        if names is None or boxes is None or len(names) == 0:
+            return {}
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        names = np.asarray(names)
+        return {name: boxes[names == name] for name in set(names.tolist())}
+
+    def _counts_changed(self, counts) -> bool:
+        classes = set(counts) | set(self._last_counts)
+        delta = sum(abs(counts.get(c, 0) - self._last_counts.get(c, 0)) for c in classes)
+        return delta >= self.count_delta
+
+    def _moved(self, grouped) -> bool:
+        for name, boxes in grouped.items():
+            last = self._last_boxes.get(name)
+            if last is None or len(last) == 0 or len(boxes) == 0:
+                continue  # appearing/leaving classes are a counts change
+            if (box_iou(boxes, last).max(axis=1) < self.move_iou).any():
+                return True
+        return False
+
+    def update(self, counts, names=None, boxes=None, now: float = None) -> Optional[str]:
+        """
+        Feed one frame's detections (counts per class, plus names/boxes per detection
+        for motion); returns why it should be captioned ("first", "counts", "motion",
+        "stale") or None to skip it. Without boxes only counts and staleness apply.
+        """
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        if not counts:
+            if self._empty_since is None:
+                self._empty_since = now
+            elif now - self._empty_since >= self.empty_hold:
+                # Really emptied (not a flickering frame): a reappearance triggers "counts"
+                self._last_counts = Counter()
+                self._last_boxes = {}
+            return None
+        self._empty_since = None
+
+        grouped = self._group_boxes(names, boxes)
+        if self._last_at is None:
+            reason = "first"
+        elif now - self._last_at < self.min_interval:
+            reason = None
+        elif self._counts_changed(counts):
+            reason = "counts"
+        elif self._moved(grouped):
+            reason = "motion"
+        elif now - self._last_at >= self.max_staleness:
+            reason = "stale"
+        else:
+            reason = None
+
+        if reason is None:
+            self.skipped += 1
+            return None
+        self.sampled += 1
+        self.triggers[reason] += 1
+        self._last_at = now
+        self._last_counts = Counter(counts)
+        self._last_boxes = grouped
+        return reason
+
+    def stats(self) -> dict:
+        considered = self.sampled + self.skipped
+        return {
+            "frames": self.frames,
+            "sampled": self.sampled,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / considered, 3) if considered else 0.0,
+            "triggers": dict(self.triggers),
+            "max_staleness_s": self.max_staleness,
+            "move_iou": self.move_iou,
+        }
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from Metrics import timed
+
+SEARCH_INDEX_DIR = os.getenv(
+    "SEARCH_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search")
+)
+# CLIP puts text and images in one space: caption text and keyframe pixels share an index
+SEARCH_EMBED_MODEL = os.getenv("SEARCH_EMBED_MODEL", "clip-ViT-B-32")
+
+
+class SearchIndex:
+    """
+    Semantic search over captions and keyframes of videos and live sources.
+
+    Entries are CLIP embeddings of caption text ("caption") and of the keyframe image
+    ("keyframe"), L2-normalised in a FAISS inner-product index (cosine similarity), with
+    metadata per entry: video id, title, frame, timestamp in seconds (video time, or
+    epoch seconds for live sources) and caption. Entries are keyed by
+    (video, frame, kind), so re-adding a frame replaces it rather than duplicating it.
+
+    The embedding model and FAISS are imported on first use. save()/load() persist the
+    index and metadata under SEARCH_INDEX_DIR.
+    """
+
+    def __init__(self, directory: str = SEARCH_INDEX_DIR, model_name: str = SEARCH_EMBED_MODEL):
+        self.directory = directory
+        self.model_name = model_name
+        self._model = None
+        self._index = None
+        self._meta: Dict[int, dict] = {}
+        self._keys: Dict[tuple, int] = {}
+        self._video_ids: Dict[str, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._dirty = False
+        self.searches = 0
+
+    # -- model / index ----------------------------------------------------------------
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def _ensure_index(self, dim: int):
+        if self._index is None:
+            import faiss
+
+            # Exact search; at a few keyframes per minute, hours of footage are tens of
+            # thousands of vectors, which a flat index scans in milliseconds
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def _embed(self, items) -> np.ndarray:
+        model = self._get_model()
+        with timed("embed", items=len(items)):
+            vectors = model.encode(
+                items, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+            )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    # -- adding -----------------------------------------------------------------------
+    def _add(self, vectors: np.ndarray, metas: List[dict]):
+        if not metas:
+            return
+        with self._lock:
+            self._ensure_index(vectors.shape[1])
+            stale = [self._keys[m["key"]] for m in metas if m["key"] in self._keys]
+            if stale:
+                self._index.remove_ids(np.asarray(stale, dtype=np.int64))
+                for old in stale:
+                    meta = self._meta.pop(old, None)
+                    if meta is not None:
+                        self._video_ids.get(meta["video"], set()).discard(old)
+            ids = np.arange(self._next_id, self._next_id + len(metas), dtype=np.int64)
+            self._next_id += len(metas)
+            self._index.add_with_ids(vectors, ids)
+            for entry_id, meta in zip(ids.tolist(), metas):
+                self._keys[meta["key"]] = entry_id
+                self._meta[entry_id] = meta
+                self._video_ids.setdefault(meta["video"], set()).add(entry_id)
+            self._dirty = True
+
+    def add(self, video: str, captions: Dict[int, str] = None, keyframes: Dict[int, object] = None,
+            fps: float = None, timestamps: Dict[int, float] = None, title: str = None):
+        """
+        Index captions ({frame: caption}) and/or keyframes ({frame: PIL image}) of one video.
+
+        Timestamps come from timestamps[frame] if given, else frame / fps, else None.
+        Returns the number of entries added.
+        """
+        captions = captions or {}
+        keyframes = keyframes or {}
+        timestamps = timestamps or {}
+
+        def meta(frame, kind):
+            ts = timestamps.get(frame)
+            if ts is None and fps:
+                ts = round(frame / fps, 3)
+            caption = captions.get(frame)
+            return {
+                "key": (str(video), int(frame), kind),
+                "video": str(video),
+                "title": title,
+                "frame": int(frame),
+                "timestamp": ts,
+                "kind": kind,
+                "caption": None if caption is None else str(caption),
+                "added_at": time.time(),
+            }
+
+        added = 0
+        if captions:
+            frames = list(captions)
+            texts = [getattr(captions[f], "text", None) or str(captions[f]) for f in frames]
+            self._add(self._embed(texts), [meta(f, "caption") for f in frames])
+            added += len(frames)
+        if keyframes:
+            frames = list(keyframes)
+            images = [keyframes[f] for f in frames]
+            self._add(self._embed(images), [meta(f, "keyframe") for f in frames])
+            added += len(frames)
+        return added
+
+    def has_video(self, video: str) -> bool:
+        return bool(self._video_ids.get(str(video)))
+
+    def _selected_ids(self, video, kind) -> np.ndarray:
+        """Ids of the entries a filtered search may return (call with the lock held)."""
+        if video is not None:
+            ids = self._video_ids.get(str(video), ())
+        else:
+            ids = self._meta.keys()
+        if kind is not None:
+            ids = [i for i in ids if self._meta[i]["kind"] == kind]
+        return np.fromiter(ids, dtype=np.int64)
+
+    # -- searching --------------------------------------------------------------------
+    def search(self, query: str, k: int = 10, video: Optional[str] = None, kind: Optional[str] = None) -> List[dict]:
+        """
+        Best matching frames for a text query. A frame matched by both its caption and its
+        keyframe is returned once with the higher score. Optionally restricted to one
+        video and/or one kind ("caption" / "keyframe").
+        """
+        self.searches += 1
+        if self._index is None or self._index.ntotal == 0:
+            return []
+        vector = self._embed([query])
+        with self._lock:
+            params, total = None, self._index.ntotal
+            if video is not None or kind is not None:
+                # Filter inside FAISS so a small video among hours of footage still gets its k best
+                import faiss
+
+                selected = self._selected_ids(video, kind)
+                if len(selected) == 0:
+                    return []
+                # selected and selector must outlive the search call (FAISS keeps raw pointers)
+                selector = faiss.IDSelectorBatch(len(selected), faiss.swig_ptr(selected))
+                params = faiss.SearchParameters(sel=selector)
+                total = len(selected)
+            # Over-fetch: a frame's caption and keyframe entries merge into one hit
+            fetch = min(total, max(k * 4, 32))
+            with timed("search"):
+                scores, ids = self._index.search(vector, fetch, params=params)
+            candidates = [(float(s), self._meta.get(int(i))) for s, i in zip(scores[0], ids[0]) if i >= 0]
+
+        # Candidates come best-first, so the first hit per frame carries its best score
+        best = {}
+        for score, meta in candidates:
+            if meta is None or (video and meta["video"] != video) or (kind and meta["kind"] != kind):
+                continue
+            frame_key = (meta["video"], meta["frame"])
+            hit = best.get(frame_key)
+            if hit is None:
+                hit = best[frame_key] = {
+                    "video": meta["video"],
+                    "title": meta["title"],
+                    "frame": meta["frame"],
+                    "timestamp": meta["timestamp"],
+                    "caption": meta["caption"],
+                    "matched": meta["kind"],
+                    "score": round(score, 4),
+                }
+            if hit["caption"] is None:
+                hit["caption"] = meta["caption"]
+        return list(best.values())[:k]
+
+    # -- persistence ------------------------------------------------------------------
+    def save(self):
+        if not self._dirty or self._index is None:
+            return
+        import faiss
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            faiss.write_index(self._index, os.path.join(self.directory, "index.faiss"))
+            entries = {str(i): {**m, "key": list(m["key"])} for i, m in self._meta.items()}
+            self._dirty = False
+        tmp = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "next_id": self._next_id, "entries": entries}, f)
+        os.replace(tmp, os.path.join(self.directory, "meta.json"))
+
+    def load(self) -> bool:
+        """Load a saved index built with the same embedding model; False if there is none."""
+        index_path = os.path.join(self.directory, "index.faiss")
+        meta_path = os.path.join(self.directory, "meta.json")
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return False
+        with open(meta_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("model") != self.model_name:
+            print(f"Search index was built with {saved.get('model')}, not {self.model_name}; starting empty")
+            return False
+        import faiss
+
+        with self._lock:
+            self._index = faiss.read_index(index_path)
+            self._meta = {int(i): {**m, "key": tuple(m["key"])} for i, m in saved["entries"].items()}
+            self._keys = {m["key"]: i for i, m in self._meta.items()}
+            self._video_ids = {}
+            for i, m in self._meta.items():
+                self._video_ids.setdefault(m["video"], set()).add(i)
+            self._next_id = saved["next_id"]
+        return True
+
+    def stats(self) -> dict:
+        kinds = {}
+        for meta in list(self._meta.values()):
+            kinds[meta["kind"]] = kinds.get(meta["kind"], 0) + 1
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "entries": 0 if self._index is None else self._index.ntotal,
+            "by_kind": kinds,
+            "videos": sum(1 for ids in list(self._video_ids.values()) if ids),
+            "searches": self.searches,
+        }
@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict
+
+# Sent frames not acknowledged within this many seconds are treated as lost
+SENT_EXPIRY = 2.0
+
+# (output scale, JPEG quality) from best to cheapest; the controller moves along this ladder
+STREAM_LEVELS = [
+    (1.0, 85),
+    (1.0, 70),
+    (0.75, 70),
+    (0.75, 55),
+    (0.5, 55),
+    (0.5, 40),
+    (0.35, 40),
+]
+
+
+class AdaptiveStreamController:
+    """
+    Per-client send rate, JPEG quality and resolution for the live stream.
+
+    Latency is estimated as the smoothed round-trip time of acknowledged frames plus the
+    server-side processing time (detection + encoding). Above target_latency the stream
+    steps down STREAM_LEVELS and then lowers the frame rate; well below it, the frame
+    rate recovers first and then the quality. Clients that never acknowledge frames
+    are only paced at max_fps.
+    """
+
+    def __init__(self, target_latency: float = 0.15, min_fps: float = 2.0, max_fps: float = 30.0,
+                 max_in_flight: int = 3, levels=STREAM_LEVELS):
+        self.target_latency = target_latency
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.max_in_flight = max_in_flight
+        self.levels = levels
+        self.level = 0
+        self.fps = max_fps
+        self.rtt = None
+        self.processing = None
+        self._sent = OrderedDict()  # frame_count -> monotonic send time, in send order
+        self._last_send = 0.0
+        self._last_adjust = 0.0
+        self._acks_seen = False
+
+    @property
+    def scale(self) -> float:
+        return self.levels[self.level][0]
+
+    @property
+    def quality(self) -> int:
+        return self.levels[self.level][1]
+
+    @staticmethod
+    def _smooth(current, sample, alpha=0.2):
+        return sample if current is None else (1 - alpha) * current + alpha * sample
+
+    def should_send(self, now: float = None) -> bool:
+        """False if this frame should be skipped to honour the frame rate or in-flight limit."""
+        now = time.monotonic() if now is None else now
+        if now - self._last_send < 1.0 / self.fps:
+            return False
+        if self._acks_seen and len(self._sent) >= self.max_in_flight:
+            # Client is behind; stale entries expire so a lost ack cannot stall the stream
+            oldest = next(iter(self._sent.values()))
+            if now - oldest < SENT_EXPIRY:
+                return False
+            self._sent.clear()
+        return True
+
+    def on_sent(self, frame_count: int, processing: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        self._last_send = now
+        self._sent[frame_count] = now
+        # Bounded whether or not the client acks: expired entries can no longer be acked usefully
+        while self._sent and now - next(iter(self._sent.values())) >= SENT_EXPIRY:
+            self._sent.popitem(last=False)
+        self.processing = self._smooth(self.processing, processing)
+
+    def on_ack(self, frame_count: int, now: float = None):
+        now = time.monotonic() if now is None else now
+        sent_at = self._sent.pop(frame_count, None)
+        # Anything older than the acked frame was dropped or rendered out of order
+        while self._sent and next(iter(self._sent)) < frame_count:
+            self._sent.popitem(last=False)
+        if sent_at is None:
+            return
+        self._acks_seen = True
+        self.rtt = self._smooth(self.rtt, now - sent_at)
+        self._adjust(now)
+
+    def _adjust(self, now: float):
+        if now - self._last_adjust < 0.5:
+            return
+        self._last_adjust = now
+
+        latency = (self.rtt or 0.0) + (self.processing or 0.0)
+        if latency > self.target_latency * 1.2:
+            if self.level < len(self.levels) - 1:
+                self.level += 1
+            else:
+                self.fps = max(self.min_fps, self.fps * 0.8)
+        elif latency < self.target_latency * 0.6:
+            if self.fps < self.max_fps:
+                self.fps = min(self.max_fps, self.fps * 1.25)
+            elif self.level > 0:
+                self.level -= 1
+
+    def settings(self) -> dict:
+        """Current settings, sent with every frame."""
+        return {
+            "fps": round(self.fps, 1),
+            "quality": self.quality,
+            "scale": self.scale,
+            "level": self.level,
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "processing_ms": round(self.processing * 1000, 1) if self.processing is not None else None,
+            "target_ms": round(self.target_latency * 1000),
+        }
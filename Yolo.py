@@ -1,37 +1,83 @@
+import math
+import threading
+import time
 from collections import Counter
+from typing import List, NamedTuple, Optional
+
 import cv2
-from ultralytics import YOLO
+import numpy as np
+
+from Metrics import timed, unrecorded
 
-# Load a pretrained detection model once
+# Pretrained detection weights, loaded once on first use
 # You can swap to "yolo11s.pt" / "yolo11m.pt" if you need better accuracy
-model = YOLO("yolo11s.pt")
+_WEIGHTS = "yolo11s.pt"
 
+_model = None
+_model_lock = threading.Lock()
 
-def detect_objects_yolo(frame, conf: float = 0.25, iou: float = 0.5):
-    """
-    Run YOLO object detection on a frame.
 
-    Returns:
-        raw_names: list[str]     -> class names for each detection (duplicates kept)
-        counts: Counter          -> counts per class name
-        annotated_frame: ndarray -> original frame with boxes/labels drawn
-    """
-    results = model(frame, verbose=False, conf=conf, iou=iou)[0]
-    annotated_frame = frame.copy()
+def get_model():
+    """The shared YOLO model, loaded (thread-safely) on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from ultralytics import YOLO
+
+                _model = YOLO(_WEIGHTS)
+    return _model
+
+
+def is_loaded() -> bool:
+    return _model is not None
+
 
-    # Handle no detections
-    if results.boxes is None or len(results.boxes) == 0:
-        return [], Counter(), annotated_frame
+def warm_up():
+    """Run one detection on a blank frame so the first real frame doesn't pay for setup."""
+    with unrecorded():
+        detect_batch([np.zeros((640, 640, 3), dtype=np.uint8)], annotate=False)
 
-    class_ids = results.boxes.cls.cpu().numpy().astype(int)
-    confs = results.boxes.conf.cpu().numpy()
-    boxes = results.boxes.xyxy.cpu().numpy()
-    names = results.names  # list/dict from ultralytics
 
-    # Draw detections
-    for cls_id, c, box in zip(class_ids, confs, boxes):
+def __getattr__(name):
+    # Yolo.model used to be created at import; keep it reachable (and lazy)
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Detections(NamedTuple):
+    names: List[str]                  # class name per detection (duplicates kept)
+    counts: Counter                   # counts per class name
+    boxes: np.ndarray                 # (N, 4) xyxy in frame pixels
+    confs: np.ndarray                 # (N,) confidences
+    annotated: Optional[np.ndarray]   # frame with boxes drawn, or the untouched frame if not annotating
+
+
+_NO_BOXES = np.zeros((0, 4), dtype=np.float32)
+_NO_CONFS = np.zeros((0,), dtype=np.float32)
+
+
+def _parse_result(result):
+    """names, boxes, confs from one ultralytics result with a single device->host copy."""
+    if result.boxes is None or len(result.boxes) == 0:
+        return [], _NO_BOXES, _NO_CONFS
+
+    # boxes.data rows are [x1, y1, x2, y2, (track id), conf, cls]
+    data = result.boxes.data.cpu().numpy()
+    boxes = data[:, :4]
+    confs = data[:, -2]
+    class_ids = data[:, -1].astype(int)
+    names = [result.names[int(c)] for c in class_ids]
+    return names, boxes, confs
+
+
+def draw_detections(frame, names, boxes, confs, copy: bool = True):
+    """Draw boxes/labels on frame (on a copy unless copy=False)."""
+    annotated_frame = frame.copy() if copy else frame
+    for name, c, box in zip(names, confs, boxes):
         x1, y1, x2, y2 = map(int, box)
-        label = f"{names[int(cls_id)]} {float(c):.2f}"
+        label = f"{name} {float(c):.2f}"
 
         cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
         cv2.putText(
@@ -44,8 +90,124 @@ def detect_objects_yolo(frame, conf: float = 0.25, iou: float = 0.5):
             2,
             cv2.LINE_AA,
         )
+    return annotated_frame
+
+
+def detect_batch(frames, conf: float = 0.25, iou: float = 0.5, annotate: bool = True) -> List[Detections]:
+    """
+    Run YOLO on a list of frames in a single model call.
+
+    With annotate=False no frame is copied or drawn on; Detections.annotated is then
+    the input frame itself.
+    """
+    frames = list(frames)
+    if not frames:
+        return []
+
+    model = get_model()
+    with timed("yolo", items=len(frames)):
+        results = model(frames, verbose=False, conf=conf, iou=iou)
+        detections = []
+        for frame, result in zip(frames, results):
+            names, boxes, confs = _parse_result(result)
+            annotated = draw_detections(frame, names, boxes, confs) if annotate else frame
+            detections.append(Detections(names, Counter(names), boxes, confs, annotated))
+    return detections
+
+
+def detect_objects_yolo(frame, conf: float = 0.25, iou: float = 0.5, annotate: bool = True):
+    """
+    Run YOLO object detection on a frame.
+
+    Returns:
+        raw_names: list[str]     -> class names for each detection (duplicates kept)
+        counts: Counter          -> counts per class name
+        annotated_frame: ndarray -> original frame with boxes/labels drawn
+                                    (the original frame itself when annotate=False)
+    """
+    det = detect_batch([frame], conf=conf, iou=iou, annotate=annotate)[0]
+    return det.names, det.counts, det.annotated
+
+
+class DetectionTracker:
+    """
+    Run full detection only every detect_every frames and carry the last boxes forward
+    on the frames in between.
+
+    With target_fps set, detect_every is re-derived after each detection from the
+    measured detection time so the average per-frame cost fits the frame budget
+    (capped at max_detect_every). Not thread-safe: use one tracker per stream.
+    """
+
+    def __init__(self, detect_every: int = 1, target_fps: Optional[float] = None, max_detect_every: int = 15,
+                 conf: float = 0.25, iou: float = 0.5, annotate: bool = True):
+        self.detect_every = max(1, int(detect_every))
+        self.target_fps = target_fps
+        self.max_detect_every = max(1, int(max_detect_every))
+        self.conf = conf
+        self.iou = iou
+        self.annotate = annotate
+        self.frames = 0
+        self.detections_run = 0
+        self._since_detect = 0
+        self._last = None
+
+    def _adapt(self, seconds_per_frame: float):
+        if self.target_fps:
+            needed = math.ceil(seconds_per_frame * self.target_fps)
+            self.detect_every = min(self.max_detect_every, max(1, needed))
+
+    def _carry(self, frame) -> Detections:
+        last = self._last
+        annotated = draw_detections(frame, last.names, last.boxes, last.confs) if self.annotate else frame
+        return Detections(last.names, last.counts, last.boxes, last.confs, annotated)
+
+    def update(self, frame) -> Detections:
+        """Detections for the next frame of the stream."""
+        self.frames += 1
+        if self._last is not None and self._since_detect < self.detect_every:
+            self._since_detect += 1
+            return self._carry(frame)
+
+        t0 = time.perf_counter()
+        self._last = detect_batch([frame], conf=self.conf, iou=self.iou, annotate=self.annotate)[0]
+        self._adapt(time.perf_counter() - t0)
+        self.detections_run += 1
+        self._since_detect = 1
+        return self._last
+
+    def update_batch(self, frames) -> List[Detections]:
+        """Like update() for consecutive frames, running the due detections in one batched call."""
+        frames = list(frames)
+        due, pos = [], self._since_detect
+        for i in range(len(frames)):
+            if (self._last is None and not due) or pos >= self.detect_every:
+                due.append(i)
+                pos = 0
+            pos += 1
+
+        t0 = time.perf_counter()
+        fresh = dict(zip(due, detect_batch([frames[i] for i in due], self.conf, self.iou, self.annotate)))
+        if due:
+            self._adapt((time.perf_counter() - t0) / len(due))
 
-    raw_names = [names[int(c)] for c in class_ids]
-    counts = Counter(raw_names)
+        out = []
+        for i, frame in enumerate(frames):
+            self.frames += 1
+            if i in fresh:
+                self._last = fresh[i]
+                self.detections_run += 1
+                self._since_detect = 1
+                out.append(self._last)
+            else:
+                self._since_detect += 1
+                out.append(self._carry(frame))
+        return out
 
-    return raw_names, counts, annotated_frame
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "detections_run": self.detections_run,
+            "detect_every": self.detect_every,
+            "target_fps": self.target_fps,
+        }
@@ -1,27 +1,19 @@
 import cv2
 from PIL import Image
 from Captioning import predict_captions  # Make sure this is your correct caption file
-from Yolo import detect_objects_yolo
+from Yolo import detect_batch
+from Sampling import ChangeDrivenSampler
+from FrameSource import open_source
 import streamlit as st
 import numpy as np
 
 
-def find_working_camera():
-    for index in range(5):
-        cap = cv2.VideoCapture(index)
-        if cap.isOpened():
-            ret, _ = cap.read()
-            cap.release()
-            if ret:
-                return index
-    raise IOError("❌ No working camera found. Try plugging in a different webcam.")
+def live_caption_streamlit(batch_size=1, source="auto", max_staleness=10.0):
+    # Latest-frame grabbing keeps the view real-time even when YOLO + captioning lag behind
+    source = open_source(source).start()
+    # Caption when the detections change instead of every Nth frame
+    sampler = ChangeDrivenSampler(max_staleness=max_staleness)
 
-
-def live_caption_streamlit(every_n_frames=15, batch_size=1):
-    cam_index = find_working_camera()
-    cap = cv2.VideoCapture(cam_index)
-
-    frame_idx = 0
     imgs, meta_info = [], []
     last_caption = ""
 
@@ -29,18 +21,22 @@ def live_caption_streamlit(every_n_frames=15, batch_size=1):
     caption_placeholder = st.empty()
     st.markdown("**Press 'Stop' in the top right to exit the stream**")
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+    while source.running:
+        grabbed = source.read(timeout=2.0)
+        if grabbed is None:
+            if source.ended:
+                break
             st.error("Failed to read frame from camera.")
-            break
+            continue
+        frame = grabbed.image
 
-        detected_objects, annotated = detect_objects_yolo(frame)
+        det = detect_batch([frame])[0]
+        annotated = det.annotated
 
-        if frame_idx % every_n_frames == 0 and detected_objects:
+        if sampler.update(det.counts, det.names, det.boxes):
             pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             imgs.append(pil_img)
-            meta_info.append(", ".join(detected_objects))
+            meta_info.append(", ".join(det.names))
 
         if len(imgs) == batch_size:
             try:
@@ -57,9 +53,8 @@ def live_caption_streamlit(every_n_frames=15, batch_size=1):
         annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
         stframe.image(annotated_rgb, channels="RGB")
 
-        frame_idx += 1
-
-    cap.release()
+    source.stop()
+    st.caption(f"Caption calls skipped: {sampler.skipped} of {sampler.sampled + sampler.skipped}")
 
 
 def run_streamlit_ui():
@@ -1,30 +1,126 @@
 from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 import os
 import cv2
 import asyncio
 import base64
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from PIL import Image
 import io
 import numpy as np
 from collections import defaultdict
 import json
+import tempfile
+import time
 import traceback
+from contextlib import asynccontextmanager
 
 # FIX: Point to parent directory where the modules are located
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(BASE_DIR)
 
-from Captioning import predict_captions
-from Yolo import detect_objects_yolo
-from LLMs import useCohere
-from main import caption_video, detect_scene_changes, caption_video_by_scenes
+from Captioning import predict_captions, enable_caption_cache, caption_cache_stats
+from Yolo import detect_objects_yolo, DetectionTracker
+from LLMs import useCohere, get_async_client, summary_cache_stats, summary_settings
+from main import caption_video, caption_video_budgeted, keyframe_budget, probe_video
+from Inference import CaptionScheduler, InferenceExecutor, QueueFull
+from StreamControl import AdaptiveStreamController
+from Metrics import Gauge, render_prometheus, request_timings, timed
+from Jobs import JobQueue
+from FrameSource import find_working_camera, open_source
+from Models import ModelManager
+from ResultStore import ResultStore, content_hasher
+from SearchIndex import SearchIndex
+from Sampling import ChangeDrivenSampler
+import Captioning
+import LLMs
+import Yolo
 
-app = FastAPI(title="KAUST Vision Captioning System")
+# Live camera feeds send long runs of near-identical frames; reuse their captions.
+# Only CameraService reads the cache: uploads and video jobs pass use_cache=False, so an
+# unrelated but similar-looking (dark, low-texture) image never gets another one's caption.
+enable_caption_cache()
+
+# End-to-end latency (round trip + processing) the live stream adapts towards
+STREAM_TARGET_LATENCY = float(os.getenv("STREAM_TARGET_LATENCY_MS", "150")) / 1000
+
+# Frame rate the live YOLO loop must sustain; detection runs every Kth frame to hold it
+YOLO_TARGET_FPS = float(os.getenv("YOLO_TARGET_FPS", "15"))
+# Live frames are captioned when detections change (counts or box movement), at least
+# every SAMPLE_MAX_STALENESS_S while something is in view and at most once per SAMPLE_MIN_INTERVAL_S
+SAMPLE_MAX_STALENESS_S = float(os.getenv("SAMPLE_MAX_STALENESS_S", "10"))
+SAMPLE_MIN_INTERVAL_S = float(os.getenv("SAMPLE_MIN_INTERVAL_S", "1"))
+SAMPLE_MOVE_IOU = float(os.getenv("SAMPLE_MOVE_IOU", "0.5"))
+# Live source for /ws/camera: "auto" (first working camera), a device index, a file, a stream URL or "synthetic"
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "auto")
+
+# Blocking model calls run off the event loop so it keeps serving sockets.
+# One worker per model: the singletons are shared and GPU work is serialised anyway.
+detector_executor = InferenceExecutor("yolo", max_workers=1, max_pending=8)
+# Every caption request (camera samples, image uploads, video jobs) goes through one
+# scheduler, so concurrent callers share Florence-2 batches
+caption_scheduler = CaptionScheduler(
+    predict_captions,
+    max_batch_size=Captioning.caption_batch_size(),
+    max_wait_ms=float(os.getenv("CAPTION_BATCH_WAIT_MS", "20")),
+    max_queue=int(os.getenv("CAPTION_MAX_QUEUE", "32")),
+)
+
+# Uploaded videos are streamed to disk here and processed by a fixed pool of job workers
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "kaust_uploads"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+video_jobs = JobQueue(workers=int(os.getenv("VIDEO_JOB_WORKERS", "2")))
+# Rolling summaries of a video job run here so captioning never waits on the LLM
+PARTIAL_SUMMARY_EVERY = int(os.getenv("PARTIAL_SUMMARY_EVERY", "4"))
+# Keyframes captioned per video: a fixed count, optionally tightened by a captioning time budget
+KEYFRAME_BUDGET = int(os.getenv("KEYFRAME_BUDGET", "24"))
+KEYFRAME_TIME_BUDGET_S = float(os.getenv("KEYFRAME_TIME_BUDGET_S", "0")) or None
+partial_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="partial-summary")
+# Captions, scenes and summaries of processed videos, keyed by content hash (RESULTS_DB)
+results = ResultStore()
+# Semantic search over every caption and keyframe seen (SEARCH_INDEX_DIR). Entries are
+# embedded on a single background thread so captioning never waits on indexing.
+search_index = SearchIndex()
+try:
+    search_index.load()
+except Exception as e:
+    print(f"⚠️ Could not load search index, starting empty: {e}")
+index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+
+# Load and warm every model in the background at startup (set PRELOAD_MODELS=0 to load on first use)
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") != "0"
+models = ModelManager()
+models.register("yolo", Yolo.get_model, Yolo.warm_up)
+models.register("florence2", Captioning.load_model, Captioning.warm_up)
+models.register("llm", LLMs.get_backend)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block startup: the UI and /api/ready are served while models load
+    warmup = asyncio.create_task(models.load_all()) if PRELOAD_MODELS else None
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    for svc in list(camera_services.values()):
+        await svc.stop()
+    video_jobs.shutdown()
+    partial_summary_pool.shutdown(wait=False, cancel_futures=True)
+    detector_executor.shutdown()
+    caption_scheduler.shutdown()
+    index_pool.shutdown(wait=True)
+    _save_index()
+    results.close()
+
+
+app = FastAPI(title="KAUST Vision Captioning System", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,6 +158,71 @@ async def get_app_js():
         return FileResponse(js_path)
     return FileResponse(os.path.join(STATIC_DIR, "app.js"))  # fallback
 
+def _encode_jpeg_b64(frame):
+    with timed("encode"):
+        _, buffer = cv2.imencode('.jpg', frame)
+        return base64.b64encode(buffer).decode('utf-8')
+
+def _detect_frame(tracker, frame):
+    """YOLO on one camera frame (runs on the detector pool); returns names, counts, boxes and annotated frame."""
+    t0 = time.perf_counter()
+    det = tracker.update(frame)
+    return det.names, det.counts, det.boxes, det.annotated, time.perf_counter() - t0
+
+def _encode_frame(frame, scale: float, quality: int) -> bytes:
+    with timed("encode"):
+        if scale < 1.0:
+            h, w = frame.shape[:2]
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        return buffer.tobytes()
+
+class FramePacket:
+    """
+    One annotated camera frame shared by every subscriber.
+
+    Each client asks for the (scale, quality) its stream controller picked; every
+    distinct setting is encoded once per frame and shared, in a worker thread. Binary
+    clients get the JPEG bytes behind a small JSON header; base64 data URLs for JSON
+    clients are only built if such a client exists.
+    """
+
+    def __init__(self, annotated, objects, frame_count: int, processing: float):
+        self.annotated = annotated
+        self.objects = objects
+        self.frame_count = frame_count
+        self.processing = processing
+        self._encoded = {}  # (scale, quality) -> Task[bytes]
+        self._data_urls = {}
+
+    async def jpeg(self, scale: float, quality: int) -> bytes:
+        key = (scale, quality)
+        if key not in self._encoded:
+            self._encoded[key] = asyncio.create_task(asyncio.to_thread(_encode_frame, self.annotated, scale, quality))
+        return await self._encoded[key]
+
+    async def to_json(self, scale: float, quality: int, **extra) -> dict:
+        key = (scale, quality)
+        if key not in self._data_urls:
+            jpeg = await self.jpeg(scale, quality)
+            self._data_urls[key] = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('utf-8')
+        return {"frame": self._data_urls[key], "objects": self.objects, "frame_count": self.frame_count, **extra}
+
+    async def to_binary(self, scale: float, quality: int, **extra) -> bytes:
+        """[4-byte big-endian header length][UTF-8 JSON header][JPEG bytes]"""
+        jpeg = await self.jpeg(scale, quality)
+        header = json.dumps({"type": "frame", "frame_count": self.frame_count, **extra}).encode('utf-8')
+        return len(header).to_bytes(4, "big") + header + jpeg
+
+def _display_caption(caption, raw_names) -> str:
+    """
+    Caption as the API and live UI have always shown it: one name per detection,
+    "(Detected: person, person, car)". Stored and summarized captions keep the
+    CaptionRecord count form.
+    """
+    text = getattr(caption, "text", str(caption))
+    return f"{text} (Detected: {', '.join(raw_names)})" if raw_names else text
+
 @app.post("/api/upload-image")
 async def upload_image(file: UploadFile = File(...)):
     try:
@@ -69,111 +230,359 @@ async def upload_image(file: UploadFile = File(...)):
         contents = await file.read()
         image = Image.open(io.BytesIO(contents)).convert("RGB")
 
-        # YOLO detection - Fixed: unpack all 3 values
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        raw_names, counts, annotated = detect_objects_yolo(cv_image)
+        with request_timings() as timings:
+            # YOLO detection - Fixed: unpack all 3 values
+            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            raw_names, counts, annotated = await detector_executor.run(detect_objects_yolo, cv_image)
 
-        # Caption generation
-        captions = predict_captions(
-            [image],
-            extra_info=[", ".join(raw_names)] if raw_names else None
-        )
+            # Caption generation
+            captions = await caption_scheduler.caption(
+                [image],
+                detections=[counts] if counts else None,
+                use_cache=False
+            )
 
-        # Encode annotated image
-        _, buffer = cv2.imencode('.jpg', annotated)
-        annotated_b64 = base64.b64encode(buffer).decode('utf-8')
+            # Encode annotated image
+            annotated_b64 = _encode_jpeg_b64(annotated)
 
         return {
             "success": True,
-            "caption": captions[0] if captions else "No caption generated",
+            "caption": _display_caption(captions[0], raw_names) if captions else "No caption generated",
             "detected_objects": raw_names,
-            "annotated_image": f"data:image/jpeg;base64,{annotated_b64}"
+            "annotated_image": f"data:image/jpeg;base64,{annotated_b64}",
+            "timings": timings
         }
     except Exception as e:
         print(f"Image processing error: {str(e)}")
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
-@app.post("/api/upload-video")
-async def upload_video(file: UploadFile = File(...)):
-    temp_path = None
+def _index_entries(video, **entries):
+    """Add captions/keyframes to the search index; indexing failures are logged, never fatal."""
     try:
-        print(f"Processing video upload: {file.filename}, size: {file.size if hasattr(file, 'size') else 'unknown'}")
-        
-        # Create temp file with proper extension
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.mp4'
-        temp_path = os.path.join(
-            BASE_DIR,
-            f"temp_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}{file_extension}"
+        search_index.add(video, **entries)
+    except Exception as e:
+        print(f"⚠️ Search indexing failed for {video}: {e}")
+
+def _save_index():
+    try:
+        search_index.save()
+    except Exception as e:
+        print(f"⚠️ Saving search index failed: {e}")
+
+def _video_indexer(video_hash, title, fps):
+    """on_keyframes callback: index each captioned batch (captions and keyframes) as it finishes."""
+    def on_keyframes(frame_idxs, images, captions):
+        index_pool.submit(
+            _index_entries, video_hash, title=title, fps=fps,
+            captions=dict(zip(frame_idxs, captions)), keyframes=dict(zip(frame_idxs, images))
         )
-        
-        # Read and save file
-        contents = await file.read()
-        print(f"Read {len(contents)} bytes from uploaded file")
-        
-        with open(temp_path, "wb") as buffer:
-            buffer.write(contents)
-        
-        print(f"Saved video to {temp_path}")
-        
-        # Verify file was written
-        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-            raise Exception("Failed to save uploaded video file")
+    return on_keyframes
+
+# Scene-cut threshold for uploaded videos
+SCENE_THRESHOLD = 0.7
+
+
+def _caption_settings():
+    """Settings that change a video's captions; part of the results-store key."""
+    return {
+        "keyframe_budget": KEYFRAME_BUDGET,
+        "keyframe_time_budget_s": KEYFRAME_TIME_BUDGET_S,
+        "scene_threshold": SCENE_THRESHOLD,
+        "caption_model": Captioning._MODEL_ID,
+        "caption_profile": Captioning.caption_profile()["name"],
+    }
+
+
+def _video_result(scenes, captions, summary, budget, frame_count, fps):
+    duration = f"{frame_count / fps:.1f}s" if frame_count and fps else f"~{len(scenes) * 2}s estimated"
+    return {
+        "success": True,
+        "scenes": len(scenes),
+        "captions": {str(k): v for k, v in captions.items()},
+        "summary": summary,
+        "frames_processed": len(captions),
+        "keyframe_budget": budget,
+        "video_duration": duration
+    }
+
+
+def _summary_settings():
+    """summary_settings(), or None when the LLM backend is misconfigured (only summaries are lost)."""
+    try:
+        return summary_settings()
+    except Exception as e:
+        print(f"LLM backend unavailable, summary settings unknown: {e}")
+        return None
+
+
+def _cached_video_result(video_hash):
+    """Full result for a video processed before with the current settings, or None."""
+    video = results.get_video(video_hash)
+    if video is None:
+        return None
+    settings = _caption_settings()
+    cached = results.get_captions(video_hash, settings)
+    if cached is None:
+        return None
+    # Without summary settings (broken LLM config) the latest stored summary still serves
+    summary = results.get_summary(video_hash, settings, _summary_settings())
+    if summary is None:
+        return None
+    scenes, captions = cached
+    return _video_result(scenes, captions, summary, settings["keyframe_budget"], video["frame_count"], video["fps"])
+
+
+# Video captions are stored and indexed under the upload's content hash: never from the cache
+_caption_uncached = functools.partial(caption_scheduler.predict, use_cache=False)
+
+
+def _process_video(temp_path, progress=None, on_captions=None, video_hash=None, title=None):
+    """
+    Scene detection, captioning and summarization for a saved upload.
+    With video_hash, captions and summaries already in the results store are reused
+    and new ones are stored, and captions and keyframes go into the search index.
+    """
+    frame_count, fps = probe_video(temp_path)
+    settings = _caption_settings()
+    budget = keyframe_budget(KEYFRAME_BUDGET, KEYFRAME_TIME_BUDGET_S)
+    cached = results.get_captions(video_hash, settings) if video_hash else None
+    indexed = False
 
-        # Process video
-        print("Starting scene detection...")
-        scenes = detect_scene_changes(temp_path, threshold=0.7)
+    if cached is not None:
+        scenes, captions = cached
+        print(f"Reusing {len(captions)} stored captions for video {video_hash[:12]}")
+    else:
+        # Process video: scene detection and captioning share a single decode; keyframes are
+        # picked across the whole timeline within the budget
+        print(f"Starting scene detection and caption generation (budget: {budget} keyframes)...")
+        scenes, captions = caption_video_budgeted(
+            temp_path, max_keyframes=budget, threshold=SCENE_THRESHOLD, progress=progress, on_captions=on_captions,
+            on_keyframes=_video_indexer(video_hash, title, fps) if video_hash else None,
+            caption_fn=_caption_uncached
+        )
+        indexed = bool(video_hash and captions)
         print(f"Detected {len(scenes)} scenes: {scenes[:5]}...")  # Show first 5
-        
-        # Limit scenes for processing speed
-        limited_scenes = scenes[:10] if len(scenes) > 10 else scenes
-        
-        print("Starting caption generation...")
-        captions = caption_video_by_scenes(temp_path, limited_scenes)
         print(f"Generated {len(captions)} captions")
-        
+
         if not captions:
             # Fallback: try regular interval captioning
             print("No scene-based captions, trying interval-based...")
-            captions = caption_video(temp_path, every_n_frames=60, batch_size=4)
-        
-        # Generate summary
-        print("Generating summary...")
-        summary = "No content to summarize"
-        if captions:
+            captions = caption_video(temp_path, every_n_frames=60, batch_size=4, caption_fn=_caption_uncached)
+
+        if video_hash and captions:
+            results.put_captions(video_hash, settings, scenes, captions)
+
+    # Stored or fallback captions have no keyframes at hand; index their text if the
+    # video is not searchable yet
+    if video_hash and captions and not indexed and not search_index.has_video(video_hash):
+        index_pool.submit(_index_entries, video_hash, title=title, fps=fps, captions=dict(captions))
+
+    # Generate summary
+    print("Generating summary...")
+    summary = "No content to summarize"
+    if captions:
+        summary_key = _summary_settings() if video_hash else None
+        stored = results.get_summary(video_hash, settings, summary_key) if video_hash else None
+        if stored is not None:
+            summary = stored
+        else:
             try:
                 summary = useCohere(captions)
                 print(f"Generated summary: {summary[:100]}...")
+                if video_hash and summary_key is not None:
+                    results.put_summary(video_hash, settings, summary_key, summary)
             except Exception as e:
                 print(f"Summary generation failed: {e}")
                 summary = f"Video processed successfully with {len(captions)} captions, but summary generation failed."
 
-        result = {
-            "success": True,
-            "scenes": len(scenes),
-            "captions": {str(k): v for k, v in captions.items()},
-            "summary": summary,
-            "frames_processed": len(captions),
-            "video_duration": f"~{len(scenes) * 2}s estimated"  # rough estimate
-        }
-        
-        print(f"Video processing complete. Result: {len(result['captions'])} captions, summary: {len(summary)} chars")
+    result = _video_result(scenes, captions, summary, budget, frame_count, fps)
+    print(f"Video processing complete. Result: {len(result['captions'])} captions, summary: {len(summary)} chars")
+    return result
+
+class _CaptionStreamer:
+    """
+    on_captions callback for a video job: emits a "caption" event per caption and,
+    every PARTIAL_SUMMARY_EVERY new captions, a rolling "partial_summary" of all
+    captions so far. Only one partial summary per job is in flight at a time.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.captions = {}
+        self._summarized = 0
+        self._pending = None
+
+    def __call__(self, frame_idxs, captions):
+        for frame_idx, caption in zip(frame_idxs, captions):
+            self.captions[frame_idx] = caption
+            self.job.emit("caption", {"frame": frame_idx, "caption": caption})
+
+        new = len(self.captions) - self._summarized
+        if new >= PARTIAL_SUMMARY_EVERY and (self._pending is None or self._pending.done()):
+            self._summarized = len(self.captions)
+            # Keep the job's timing context so LLM time shows up in its timings
+            ctx = contextvars.copy_context()
+            self._pending = partial_summary_pool.submit(ctx.run, self._summarize, dict(self.captions))
+
+    def _summarize(self, captions):
+        try:
+            summary = useCohere(captions)
+            self.job.emit("partial_summary", {"summary": summary, "caption_count": len(captions)})
+        except Exception as e:
+            print(f"Partial summary failed: {e}")
+
+def _run_video_job(job, temp_path, video_hash=None, title=None):
+    """Job worker entry point: process the upload, then delete it."""
+    try:
+        with request_timings() as timings:
+            result = _process_video(
+                temp_path, progress=job.report_progress, on_captions=_CaptionStreamer(job), video_hash=video_hash,
+                title=title
+            )
+        result["timings"] = timings
         return result
-        
+    finally:
+        # Queued after this job's index batches, so it persists them
+        index_pool.submit(_save_index)
+        try:
+            os.remove(temp_path)
+            print(f"Cleaned up temp file: {temp_path}")
+        except OSError as e:
+            print(f"Failed to cleanup {temp_path}: {e}")
+
+def _write_chunk(buffer, hasher, chunk):
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+@app.post("/api/upload-video")
+async def upload_video(file: UploadFile = File(...)):
+    """Stream the upload to disk in chunks and queue it; returns a job ID right away."""
+    temp_path = None
+    try:
+        print(f"Receiving video upload: {file.filename}")
+
+        # Create temp file with proper extension
+        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.mp4'
+        fd, temp_path = tempfile.mkstemp(prefix="upload_", suffix=file_extension or '.mp4', dir=UPLOAD_DIR)
+
+        # Hash while streaming so repeat uploads are recognised without re-reading the file
+        hasher = content_hasher()
+        size = 0
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(_write_chunk, buffer, hasher, chunk)
+                size += len(chunk)
+        video_hash = hasher.hexdigest()
+        print(f"Saved {size} bytes to {temp_path} (blake2b {video_hash[:12]})")
+
+        if size == 0:
+            raise Exception("Failed to save uploaded video file")
+
+        cached = await asyncio.to_thread(_cached_video_result, video_hash)
+        if cached is not None:
+            print(f"Serving stored result for video {video_hash[:12]}")
+            job = video_jobs.complete({**cached, "cached": True})
+            return {"success": True, "job_id": job.id, "status": job.status, "cached": True}
+
+        frame_count, fps = await asyncio.to_thread(probe_video, temp_path)
+        await asyncio.to_thread(results.put_video, video_hash, file.filename, size, frame_count, fps)
+        job = video_jobs.submit(_run_video_job, temp_path, video_hash, file.filename)
+        temp_path = None  # owned by the job from here on
+        return {"success": True, "job_id": job.id, "status": job.status}
+
     except Exception as e:
-        error_msg = f"Video processing error: {str(e)}"
+        error_msg = f"Video upload error: {str(e)}"
         print(error_msg)
         traceback.print_exc()
         return {"success": False, "error": error_msg}
     finally:
-        # Cleanup temp file
         if temp_path and os.path.exists(temp_path):
             try:
                 os.remove(temp_path)
-                print(f"Cleaned up temp file: {temp_path}")
-            except Exception as e:
+            except OSError as e:
                 print(f"Failed to cleanup {temp_path}: {e}")
 
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = video_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+    return {"success": True, **job.to_dict()}
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events for a video job: progress, each caption as its batch finishes,
+    rolling partial summaries, then "done" (with the full result) or "failed".
+    """
+    job = video_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+
+    async def stream():
+        index = 0
+        idle = 0.0
+        while True:
+            events = job.events_since(index)
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+            index += len(events)
+            if job.finished and index >= len(job.events):
+                break
+            if events:
+                idle = 0.0
+            elif idle >= 15.0:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(0.2)
+            idle += 0.2
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = video_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+    if job.status == "failed":
+        return {"success": False, "error": f"Video processing error: {job.error}", **job.to_dict()}
+    if job.status != "done":
+        return JSONResponse({"success": False, **job.to_dict()}, status_code=202)
+    return job.result
+
+@app.get("/api/search")
+async def search(q: str, k: int = 10, video: str = None, kind: str = None):
+    """
+    Frames whose caption or keyframe best match a text query, across every processed
+    video and live session. video restricts to one video hash or live session,
+    kind to "caption" or "keyframe".
+    """
+    if not q.strip():
+        return JSONResponse({"success": False, "error": "Empty query"}, status_code=400)
+    if kind not in (None, "", "caption", "keyframe"):
+        return JSONResponse({"success": False, "error": f"Unknown kind: {kind}"}, status_code=400)
+    t0 = time.perf_counter()
+    try:
+        hits = await asyncio.to_thread(search_index.search, q, max(1, min(k, 100)), video or None, kind or None)
+    except Exception as e:
+        print(f"Search error: {e}")
+        traceback.print_exc()
+        return {"success": False, "error": f"Search error: {str(e)}"}
+    return {
+        "success": True,
+        "query": q,
+        "results": hits,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 1)
+    }
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: list[WebSocket] = []
@@ -187,7 +596,18 @@ class ConnectionManager:
         self.connection_data[id(websocket)] = {
             'captions_this_minute': {},
             'last_minute': datetime.now().replace(second=0, microsecond=0),
-            'total_captions': 0
+            'total_captions': 0,
+            # Frames, captions and summaries are sent from different tasks
+            'send_lock': asyncio.Lock(),
+            'tasks': set(),
+            # Latest frame only: a slow client skips frames instead of building a backlog
+            'outbox': asyncio.Queue(maxsize=1),
+            'dropped_frames': 0,
+            # 'json' (base64 data URLs) or 'binary' (raw JPEG), negotiated on the start action
+            'protocol': 'json',
+            'last_objects': None,
+            # Send rate / JPEG quality / resolution, adapted from frame acks
+            'stream': AdaptiveStreamController(target_latency=STREAM_TARGET_LATENCY)
         }
 
     def disconnect(self, websocket: WebSocket):
@@ -196,14 +616,111 @@ class ConnectionManager:
         # Cleanup connection data
         conn_id = id(websocket)
         if conn_id in self.connection_data:
+            for task in self.connection_data[conn_id]['tasks']:
+                task.cancel()
             del self.connection_data[conn_id]
 
+    async def send_json(self, websocket: WebSocket, data):
+        conn_data = self.connection_data.get(id(websocket))
+        if conn_data is None:
+            return
+        async with conn_data['send_lock']:
+            await websocket.send_json(data)
+
+    async def send_bytes(self, websocket: WebSocket, data: bytes):
+        conn_data = self.connection_data.get(id(websocket))
+        if conn_data is None:
+            return
+        async with conn_data['send_lock']:
+            await websocket.send_bytes(data)
+
+    def spawn(self, websocket: WebSocket, coro):
+        """Run coro in the background for this connection; cancelled on disconnect."""
+        task = asyncio.create_task(coro)
+        conn_data = self.connection_data.get(id(websocket))
+        if conn_data is not None:
+            conn_data['tasks'].add(task)
+            task.add_done_callback(conn_data['tasks'].discard)
+        return task
+
+    def broadcast_frame(self, websockets, packet):
+        """Queue a FramePacket for each socket, replacing any frame the socket has not sent yet."""
+        for websocket in list(websockets):
+            conn_data = self.connection_data.get(id(websocket))
+            if conn_data is None:
+                continue
+            outbox = conn_data['outbox']
+            if outbox.full():
+                outbox.get_nowait()
+                conn_data['dropped_frames'] += 1
+            outbox.put_nowait(packet)
+
+    async def broadcast(self, websockets, message):
+        """Send a small control message (caption, error) to every socket, ignoring failures."""
+        for websocket in list(websockets):
+            try:
+                await self.send_json(websocket, message)
+            except Exception as e:
+                print(f"Failed to send to connection {id(websocket)}: {e}")
+
+    def add_captions(self, websocket: WebSocket, captions):
+        """Store captions for this connection's live summary; returns its caption total."""
+        conn_data = self.connection_data.get(id(websocket))
+        if conn_data is None:
+            return 0
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        conn_data['captions_this_minute'].setdefault(timestamp, []).extend(captions)
+        conn_data['total_captions'] += len(captions)
+        return conn_data['total_captions']
+
+    async def pump_frames(self, websocket: WebSocket):
+        """Send queued frames to one socket and roll up its per-minute summary."""
+        conn_data = self.connection_data[id(websocket)]
+        stream = conn_data['stream']
+        while True:
+            packet = await conn_data['outbox'].get()
+            if not stream.should_send():
+                continue
+
+            t0 = time.perf_counter()
+            await packet.jpeg(stream.scale, stream.quality)
+            processing = packet.processing + time.perf_counter() - t0
+            meta = {"total_captions": conn_data['total_captions'], "stream": stream.settings()}
+
+            if conn_data['protocol'] == 'binary':
+                # Detections go over the JSON channel, and only when they change
+                if packet.objects != conn_data['last_objects']:
+                    conn_data['last_objects'] = packet.objects
+                    await self.send_json(websocket, {
+                        "type": "detections",
+                        "objects": packet.objects,
+                        "frame_count": packet.frame_count
+                    })
+                await self.send_bytes(websocket, await packet.to_binary(stream.scale, stream.quality, **meta))
+            else:
+                await self.send_json(websocket, await packet.to_json(stream.scale, stream.quality, **meta))
+            stream.on_sent(packet.frame_count, processing)
+
+            # Check if a minute has passed for summarization
+            current_minute = datetime.now().replace(second=0, microsecond=0)
+            if (current_minute > conn_data['last_minute'] and 
+                conn_data['captions_this_minute'] and 
+                len(conn_data['captions_this_minute']) >= 3):  # Only summarize if we have enough data
+                
+                # Generate and send summary without holding up the frames
+                self.spawn(websocket, self.send_summary(websocket, conn_data['captions_this_minute']))
+                
+                # Reset for next minute
+                conn_data['captions_this_minute'] = {}
+                conn_data['last_minute'] = current_minute
+
     async def send_summary(self, websocket: WebSocket, captions_dict):
         """Generate and send live summary"""
         try:
             if captions_dict:
-                summary = useCohere(captions_dict)
-                await websocket.send_json({
+                # Pooled, retrying and coalesced: viewers of the same camera share one call
+                summary = await get_async_client().summarize(captions_dict)
+                await self.send_json(websocket, {
                     "type": "summary",
                     "summary": summary,
                     "caption_count": len(captions_dict)
@@ -213,137 +730,256 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
-def find_working_camera():
-    """Find first working camera index"""
-    print("Searching for available cameras...")
-    for index in range(5):
-        cap = cv2.VideoCapture(index)
-        if cap.isOpened():
-            ret, _ = cap.read()
-            cap.release()
-            if ret:
-                print(f"Found working camera at index {index}")
-                return index
-        cap.release()
-    print("No working camera found")
-    return None
+class CameraService:
+    """
+    Single capture loop for one camera device shared by every /ws/camera client.
+
+    Each frame is decoded, run through YOLO and JPEG-encoded once, then handed to
+    ConnectionManager.broadcast_frame. Frames to caption are picked here too, by a
+    ChangeDrivenSampler over the detections, and the results go to all subscribers.
+    The loop runs while at least one client is subscribed.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.source = None
+        self.subscribers: set[WebSocket] = set()
+        self.frame_count = 0
+        self._task = None
+        self._caption_tasks = set()
+        self.tracker = DetectionTracker(target_fps=YOLO_TARGET_FPS)
+        self.sampler = ChangeDrivenSampler(
+            move_iou=SAMPLE_MOVE_IOU, max_staleness=SAMPLE_MAX_STALENESS_S, min_interval=SAMPLE_MIN_INTERVAL_S
+        )
+
+    def subscribe(self, websocket: WebSocket):
+        self.subscribers.add(websocket)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, websocket: WebSocket):
+        self.subscribers.discard(websocket)
+
+    async def stop(self):
+        """Drop all subscribers and release the camera."""
+        self.subscribers.clear()
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _send_captions(self, caption_future, session, frames, stamps, images, names):
+        try:
+            captions = await asyncio.wrap_future(caption_future)
+        except Exception as e:
+            print(f"Caption error: {e}")
+            return
+        if not captions:
+            return
+        # Each capture session is searchable as its own "video", timestamped in epoch seconds
+        index_pool.submit(
+            _index_entries, session, title=self.source.name if self.source else str(self.spec),
+            captions=dict(zip(frames, captions)), keyframes=dict(zip(frames, images)),
+            timestamps=dict(zip(frames, stamps))
+        )
+        for websocket in list(self.subscribers):
+            total = manager.add_captions(websocket, captions)
+            await manager.broadcast([websocket], {
+                "type": "caption",
+                "caption": _display_caption(captions[-1], names[-1]),
+                "total_captions": total
+            })
+
+    async def _run(self):
+        source = None
+        finished = False
+        try:
+            try:
+                source = self.source = await asyncio.to_thread(lambda: open_source(self.spec).start())
+            except IOError:
+                await manager.broadcast(self.subscribers, {"error": "Failed to open camera"})
+                return
+
+            session = f"live:{source.name}@{datetime.now():%Y-%m-%dT%H:%M:%S}"
+            print(f"Camera {source.name} capture started")
+            while self.subscribers:
+                # The grabber thread keeps only the newest frame, so a slow loop never lags behind
+                grabbed = await asyncio.to_thread(source.read, 1.0)
+                if grabbed is None:
+                    if source.ended:
+                        await manager.broadcast(self.subscribers, {"error": "Camera stream ended"})
+                        break
+                    await manager.broadcast(self.subscribers, {"error": "Failed to read camera frame"})
+                    continue
+                frame = grabbed.image
+
+                # Always detect objects; captions are generated in the background
+                raw_names, counts, boxes, annotated, _ = await detector_executor.run(
+                    _detect_frame, self.tracker, frame
+                )
+                # Capture-to-ready latency: includes the time the frame waited to be picked up
+                processing = grabbed.age
+
+                # Caption only when the scene changed (or went stale), not on a fixed cadence
+                # The scheduler batches it with other cameras' and requests' images; the frame
+                # is dropped if the caption queue is saturated
+                if self.sampler.update(counts, raw_names, boxes):
+                    pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    try:
+                        future = caption_scheduler.submit([pil_img], detections=[counts], drop_if_full=True)
+                        task = asyncio.create_task(self._send_captions(
+                            future, session, [self.frame_count], [round(grabbed.timestamp, 3)], [pil_img],
+                            [list(raw_names)]
+                        ))
+                        self._caption_tasks.add(task)
+                        task.add_done_callback(self._caption_tasks.discard)
+                    except QueueFull:
+                        print("Caption queue full, dropping frame")
+
+                # No fixed sleep: source.read() paces the loop at camera rate and each
+                # client's stream controller decides which frames it actually sends
+                manager.broadcast_frame(
+                    self.subscribers, FramePacket(annotated, raw_names, self.frame_count, processing)
+                )
+                self.frame_count += 1
+
+            finished = True
+
+        except Exception as e:
+            print(f"Camera {self.spec} error: {e}")
+            traceback.print_exc()
+            await manager.broadcast(self.subscribers, {"error": f"Camera error: {str(e)}"})
+        finally:
+            if source:
+                await asyncio.to_thread(source.stop)
+                print(f"Camera {source.name} released")
+                index_pool.submit(_save_index)
+            # A client may have subscribed while the camera was being released
+            self._task = asyncio.create_task(self._run()) if finished and self.subscribers else None
+
+
+camera_services: dict = {}
+_camera_spec = None
+_camera_probe_lock = asyncio.Lock()
+
+async def get_camera_service():
+    """
+    Shared CameraService for CAMERA_SOURCE (a FrameSource.open_source spec: device index,
+    file, stream URL or "synthetic"); "auto" probes for the first working camera, once.
+    """
+    global _camera_spec
+    async with _camera_probe_lock:
+        if _camera_spec is None:
+            if CAMERA_SOURCE == "auto":
+                # Probing blocks, keep it off the event loop
+                _camera_spec = await asyncio.to_thread(find_working_camera)
+            else:
+                _camera_spec = CAMERA_SOURCE
+    if _camera_spec is None:
+        return None
+    if _camera_spec not in camera_services:
+        camera_services[_camera_spec] = CameraService(_camera_spec)
+    return camera_services[_camera_spec]
 
 @app.websocket("/ws/camera")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
-    cap = None
-    frame_count = 0
-    imgs_batch, meta_batch = [], []
-    
-    # Get connection-specific data
     conn_id = id(websocket)
-    conn_data = manager.connection_data[conn_id]
+    service = None
 
     try:
-        # Find working camera
-        cam_index = find_working_camera()
-        if cam_index is None:
-            await websocket.send_json({"error": "No working camera found"})
+        service = await get_camera_service()
+        if service is None:
+            await manager.send_json(websocket, {"error": "No working camera found"})
             return
 
-        cap = cv2.VideoCapture(cam_index)
-        if not cap.isOpened():
-            await websocket.send_json({"error": "Failed to open camera"})
-            return
+        # Clients announce {"action": "start", "protocol": "binary"} to receive raw JPEG
+        # frames; older clients (or none within the timeout) get base64 JSON frames
+        protocol = 'json'
+        try:
+            data = await asyncio.wait_for(websocket.receive_json(), timeout=2.0)
+            if data.get("action") == "stop":
+                return
+            if data.get("action") == "start" and data.get("protocol") == "binary":
+                protocol = 'binary'
+        except asyncio.TimeoutError:
+            pass
+        conn_data = manager.connection_data[conn_id]
+        conn_data['protocol'] = protocol
+        await manager.send_json(websocket, {"type": "hello", "protocol": protocol})
 
-        print(f"WebSocket camera feed started for connection {conn_id}")
+        service.subscribe(websocket)
+        manager.spawn(websocket, manager.pump_frames(websocket))
+        print(f"WebSocket camera feed started for connection {conn_id} ({protocol} frames)")
 
         while True:
-            try:
-                # Non-blocking receive with timeout
-                try:
-                    data = await asyncio.wait_for(websocket.receive_json(), timeout=0.01)
-                    if data.get("action") == "stop":
-                        print("Received stop command")
-                        break
-                except asyncio.TimeoutError:
-                    pass  # Continue with frame processing
-
-                ret, frame = cap.read()
-                if not ret:
-                    await websocket.send_json({"error": "Failed to read camera frame"})
-                    continue
-
-                # Process every 15th frame for captioning, but always detect objects
-                raw_names, counts, annotated = detect_objects_yolo(frame)
-                
-                caption = ""
-                if frame_count % 15 == 0 and raw_names:
-                    pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                    imgs_batch.append(pil_img)
-                    meta_batch.append(", ".join(raw_names))
-
-                # Generate captions when batch is ready
-                if len(imgs_batch) >= 3:
-                    try:
-                        captions = predict_captions(imgs_batch, extra_info=meta_batch)
-                        if captions:
-                            caption = captions[-1]
-                            
-                            # Store for live summarization
-                            timestamp = datetime.now().strftime("%H:%M:%S")
-                            conn_data['captions_this_minute'].setdefault(timestamp, []).extend(captions)
-                            conn_data['total_captions'] += len(captions)
-                            
-                    except Exception as e:
-                        print(f"Caption error: {e}")
-                    
-                    imgs_batch.clear()
-                    meta_batch.clear()
-
-                # Check if a minute has passed for summarization
-                current_minute = datetime.now().replace(second=0, microsecond=0)
-                if (current_minute > conn_data['last_minute'] and 
-                    conn_data['captions_this_minute'] and 
-                    len(conn_data['captions_this_minute']) >= 3):  # Only summarize if we have enough data
-                    
-                    # Generate and send summary
-                    await manager.send_summary(websocket, conn_data['captions_this_minute'])
-                    
-                    # Reset for next minute
-                    conn_data['captions_this_minute'] = {}
-                    conn_data['last_minute'] = current_minute
-
-                # Encode and send frame
-                _, buffer = cv2.imencode('.jpg', annotated)
-                frame_b64 = base64.b64encode(buffer).decode('utf-8')
-
-                response_data = {
-                    "frame": f"data:image/jpeg;base64,{frame_b64}",
-                    "objects": raw_names,
-                    "caption": caption,
-                    "frame_count": frame_count,
-                    "total_captions": conn_data['total_captions']
-                }
-
-                await websocket.send_json(response_data)
-                frame_count += 1
-                await asyncio.sleep(0.033)  # ~30 FPS
-
-            except WebSocketDisconnect:
-                print("WebSocket disconnected by client")
+            data = await websocket.receive_json()
+            if data.get("action") == "stop":
+                print("Received stop command")
                 break
+            if data.get("action") == "ack" and "frame_count" in data:
+                conn_data['stream'].on_ack(int(data["frame_count"]))
+
+    except WebSocketDisconnect:
+        print("WebSocket disconnected by client")
 
     except Exception as e:
         print(f"WebSocket error: {e}")
         traceback.print_exc()
         try:
-            await websocket.send_json({"error": f"Camera error: {str(e)}"})
+            await manager.send_json(websocket, {"error": f"Camera error: {str(e)}"})
         except:
             pass
 
     finally:
-        if cap:
-            cap.release()
-            print("Camera released")
+        if service:
+            service.unsubscribe(websocket)
         manager.disconnect(websocket)
         print(f"WebSocket connection {conn_id} closed")
 
+EXECUTOR_PENDING = Gauge("inference_executor_pending", "Jobs queued or running per inference executor")
+EXECUTOR_COMPLETED = Gauge("inference_executor_completed", "Jobs completed per inference executor")
+EXECUTOR_REJECTED = Gauge("inference_executor_rejected", "Jobs dropped because the executor was full")
+VIDEO_JOBS = Gauge("video_jobs", "Video jobs by state")
+CAMERA_SUBSCRIBERS = Gauge("camera_subscribers", "WebSocket clients subscribed per camera")
+CAPTION_SCHEDULER = Gauge("caption_scheduler", "Caption scheduler queue depth and counters (queued_images, batches, ...)")
+CAPTION_BATCH_SIZES = Gauge("caption_batch_size_batches", "Caption batches run, by number of images in the batch")
+CAPTION_SAMPLER = Gauge("caption_sampler_frames", "Live frames with detections sampled for captioning or skipped, per camera")
+LLM_CLIENT = Gauge("llm_client", "Async LLM client counters (in_flight, calls, coalesced, retried, failed)")
+
+@app.get("/api/metrics")
+async def metrics():
+    """Stage latency histograms and counters in Prometheus text format."""
+    for ex in (detector_executor,):
+        EXECUTOR_PENDING.set(ex.pending, executor=ex.name)
+        EXECUTOR_COMPLETED.set(ex.completed, executor=ex.name)
+        EXECUTOR_REJECTED.set(ex.rejected, executor=ex.name)
+    scheduler = caption_scheduler.stats()
+    for field in ("queued_requests", "queued_images", "requests", "batches", "images", "rejected", "failed"):
+        CAPTION_SCHEDULER.set(scheduler[field], field=field)
+    for size, count in scheduler["batch_sizes"].items():
+        CAPTION_BATCH_SIZES.set(count, size=size)
+    for state, count in video_jobs.stats().items():
+        if state != "workers":
+            VIDEO_JOBS.set(count, state=state)
+    for index, svc in camera_services.items():
+        CAMERA_SUBSCRIBERS.set(len(svc.subscribers), camera=index)
+        CAPTION_SAMPLER.set(svc.sampler.sampled, camera=index, outcome="sampled")
+        CAPTION_SAMPLER.set(svc.sampler.skipped, camera=index, outcome="skipped")
+    for field, value in get_async_client().stats().items():
+        if isinstance(value, int) and field != "max_concurrency":
+            LLM_CLIENT.set(value, field=field)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/ready")
+async def ready():
+    """Per-model load state; 503 until every model is loaded and warmed up."""
+    body = {"ready": models.ready, "models": models.status()}
+    return JSONResponse(body, status_code=200 if models.ready else 503)
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
@@ -352,7 +988,29 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "base_dir": BASE_DIR,
         "static_dir": STATIC_DIR,
-        "static_exists": os.path.exists(STATIC_DIR)
+        "static_exists": os.path.exists(STATIC_DIR),
+        "models": models.status(),
+        "caption_profile": Captioning.caption_profile(),
+        "caption_cache": caption_cache_stats(),
+        "cameras": {
+            index: {
+                "subscribers": len(svc.subscribers),
+                "frames": svc.frame_count,
+                "detector": svc.tracker.stats(),
+                "sampler": svc.sampler.stats(),
+                "source": svc.source.stats() if svc.source else None
+            }
+            for index, svc in camera_services.items()
+        },
+        "executors": {
+            ex.name: ex.stats()
+            for ex in (detector_executor,)
+        },
+        "caption_scheduler": caption_scheduler.stats(),
+        "llm": {**get_async_client().stats(), "summary_cache": summary_cache_stats()},
+        "video_jobs": video_jobs.stats(),
+        "results": results.stats(),
+        "search": search_index.stats()
     }
 
 if __name__ == "__main__":
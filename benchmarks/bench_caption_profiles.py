@@ -0,0 +1,89 @@
+"""
+Speed and quality of the Florence-2 performance profiles (Captioning.PROFILES) on CPU.
+
+Every profile captions the same fixed frame set. Quality is the ROUGE-L F1 of each
+caption against the caption from the "default" profile (fp32, 3 beams), so 1.0 means
+identical output.
+
+Usage:
+    python benchmarks/bench_caption_profiles.py [--profiles default greedy int8 fast]
+        [--images-dir path/to/frames] [--images 16] [--batch-size 4] [--compile]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Force the CPU path before torch is imported by Captioning
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from PIL import Image
+from rouge_score import rouge_scorer
+
+import Captioning
+from bench_captioning import make_frames
+
+
+def load_frames(images_dir, n):
+    """Up to n images from images_dir (sorted by name), or n synthetic frames."""
+    if not images_dir:
+        return make_frames(n)
+    names = sorted(f for f in os.listdir(images_dir) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    return [Image.open(os.path.join(images_dir, f)).convert("RGB") for f in names[:n]]
+
+
+def run_profile(profile, frames, batch_size):
+    """Load profile, warm it up, then caption frames; returns (captions, load_s, seconds)."""
+    t0 = time.perf_counter()
+    Captioning.load_model(profile)
+    load_s = time.perf_counter() - t0
+    Captioning.predict_captions(frames[:1], max_batch_size=1, use_cache=False)
+
+    t0 = time.perf_counter()
+    captions = Captioning.predict_captions(frames, max_batch_size=batch_size, use_cache=False)
+    return [c.text for c in captions], load_s, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=None, help="profiles to compare (default: all)")
+    parser.add_argument("--images-dir", default=None, help="directory of frames; synthetic frames if omitted")
+    parser.add_argument("--images", type=int, default=16, help="frames captioned per profile")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--compile", action="store_true", help="also torch.compile the vision encoder")
+    args = parser.parse_args()
+
+    # Same switch as CAPTION_COMPILE=1, applied to every profile loaded below
+    Captioning._COMPILE = Captioning._COMPILE or args.compile
+
+    profiles = args.profiles or list(Captioning.PROFILES)
+    # The reference captions always come from the default profile
+    profiles = ["default"] + [p for p in profiles if p != "default"]
+    frames = load_frames(args.images_dir, args.images)
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=True)
+
+    reference = None
+    rows = []
+    for profile in profiles:
+        captions, load_s, seconds = run_profile(profile, frames, args.batch_size)
+        if reference is None:
+            reference = captions
+        rouge = [scorer.score(ref, cap)["rougeL"].fmeasure for ref, cap in zip(reference, captions)]
+        info = Captioning.caption_profile()
+        rows.append((profile, info["dtype"], info["quantize"], info["compile"], info["num_beams"],
+                     load_s, seconds, len(frames) / seconds, sum(rouge) / len(rouge)))
+
+    print(f"\n{len(frames)} frames, batch size {args.batch_size}")
+    print(f"{'profile':>10} {'dtype':>9} {'int8':>5} {'comp':>5} {'beams':>5} "
+          f"{'load s':>7} {'seconds':>8} {'img/s':>6} {'speedup':>7} {'ROUGE-L':>7}")
+    base_seconds = rows[0][6]
+    for profile, dtype, quant, comp, beams, load_s, seconds, ips, rouge in rows:
+        print(f"{profile:>10} {dtype:>9} {str(quant):>5} {str(comp):>5} {beams:>5} "
+              f"{load_s:>7.1f} {seconds:>8.2f} {ips:>6.2f} {base_seconds / seconds:>6.2f}x {rouge:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Images-per-second benchmark for Captioning.predict_captions on CPU.
+
+Usage:
+    python benchmarks/bench_captioning.py [--batch-sizes 1 4 8 16] [--images 32]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Force the CPU path before torch is imported by Captioning
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+import numpy as np
+from PIL import Image
+
+import Captioning
+
+
+def make_frames(n, width=640, height=480, seed=0):
+    """Deterministic synthetic frames: a colour gradient plus a few solid rectangles."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        base = np.zeros((height, width, 3), dtype=np.uint8)
+        base[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+        base[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+        base[..., 2] = rng.integers(0, 256)
+        for _ in range(3):
+            x0, y0 = rng.integers(0, width // 2), rng.integers(0, height // 2)
+            x1, y1 = x0 + rng.integers(40, width // 2), y0 + rng.integers(40, height // 2)
+            base[y0:y1, x0:x1] = rng.integers(0, 256, size=3)
+        frames.append(Image.fromarray(base))
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--images", type=int, default=32, help="images captioned per batch size")
+    args = parser.parse_args()
+
+    frames = make_frames(args.images)
+
+    print("Warming up...")
+    Captioning.predict_captions(frames[:1], max_batch_size=1)
+    print(f"Device: {Captioning._DEVICE}, dtype: {Captioning._DTYPE}, model: {Captioning._MODEL_ID}")
+
+    print(f"{'batch':>6} {'images':>7} {'seconds':>9} {'img/s':>8}")
+    for bs in args.batch_sizes:
+        t0 = time.perf_counter()
+        Captioning.predict_captions(frames, max_batch_size=bs)
+        elapsed = time.perf_counter() - t0
+        print(f"{bs:>6} {len(frames):>7} {elapsed:>9.2f} {len(frames) / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Scaling of scan_video_parallel against the single-process exact scene detector.
+
+A long synthetic video with known hard cuts is scanned with an increasing number of
+worker processes. Every run should report the same scene starts as detect_scene_changes
+("same" column), whichever chunk edges the cuts fall on; speedup and parallel
+efficiency (speedup / workers) are printed per worker count. With --detect-every the
+workers also run YOLO, so compare those timings between worker counts only.
+
+Usage:
+    python benchmarks/bench_parallel_scan.py [--workers 1 2 4 8] [--scenes 120] [--detect-every 0]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+import numpy as np
+
+from bench_scene_detection import write_synthetic_video
+from main import detect_scene_changes, scan_video_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--scenes", type=int, default=120, help="scenes in the synthetic video")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--detect-every", type=int, default=0, help="also run YOLO every N frames (0 = off)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic_long.mp4")
+        truth = write_synthetic_video(path, rng, n_scenes=args.scenes)
+
+        t0 = time.perf_counter()
+        reference = detect_scene_changes(path, threshold=args.threshold)
+        base = time.perf_counter() - t0
+        print(f"cpu cores: {os.cpu_count()}, cuts: {len(truth)}, single process: {base:.2f}s "
+              f"({len(reference) - 1} cuts found)")
+        print(f"{'workers':>8} {'seconds':>9} {'frames':>7} {'speedup':>8} {'efficiency':>10} {'same':>5}")
+
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            scan = scan_video_parallel(path, threshold=args.threshold, workers=workers,
+                                       detect_every=args.detect_every)
+            elapsed = time.perf_counter() - t0
+            speedup = base / elapsed
+            print(f"{workers:>8} {elapsed:>9.2f} {scan.frames:>7} {speedup:>7.2f}x "
+                  f"{speedup / workers:>10.2f} {str(scan.scenes == reference):>5}")
+
+
+if __name__ == "__main__":
+    main()
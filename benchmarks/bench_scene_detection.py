@@ -0,0 +1,99 @@
+"""
+Speed and recall of detect_scene_changes_fast against the exact detector.
+
+Synthetic videos with known hard cuts are written to a temp directory; recall is the
+share of cuts found by the exact detector that the fast detector also reports
+(within --tolerance frames).
+
+Usage:
+    python benchmarks/bench_scene_detection.py [--videos 3] [--steps 1 2 4 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+import cv2
+import numpy as np
+
+from main import detect_scene_changes, detect_scene_changes_fast
+
+
+def _scene_image(rng, width, height):
+    """A random-hue textured image, distinct enough from other scenes to register a cut."""
+    hue = rng.integers(0, 180)
+    hsv = np.empty((height, width, 3), dtype=np.uint8)
+    hsv[..., 0] = np.clip(hue + rng.integers(-8, 9, size=(height, width)), 0, 179)
+    hsv[..., 1] = rng.integers(80, 256, size=(height, width))
+    hsv[..., 2] = rng.integers(60, 256, size=(height, width))
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+def write_synthetic_video(path, rng, n_scenes=12, width=640, height=360, fps=30):
+    """Write a video of panning scenes with hard cuts; returns the ground-truth cut frames."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    cuts, frame_idx = [], 0
+    for scene in range(n_scenes):
+        if scene:
+            cuts.append(frame_idx)
+        base = _scene_image(rng, width + 64, height)
+        for t in range(int(rng.integers(20, 90))):
+            writer.write(np.ascontiguousarray(base[:, t % 64:t % 64 + width]))
+            frame_idx += 1
+    writer.release()
+    return cuts
+
+
+def recall(found, reference, tolerance):
+    if not reference:
+        return 1.0
+    found = np.asarray(sorted(found))
+    hits = sum(1 for r in reference if found.size and np.abs(found - r).min() <= tolerance)
+    return hits / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=3)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--resize-width", type=int, default=160)
+    parser.add_argument("--tolerance", type=int, default=0, help="frames of slack when matching cuts")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        videos = []
+        for i in range(args.videos):
+            path = os.path.join(tmp, f"synthetic_{i}.mp4")
+            videos.append((path, write_synthetic_video(path, rng)))
+
+        exact_time, exact_results = 0.0, []
+        for path, truth in videos:
+            t0 = time.perf_counter()
+            scenes = detect_scene_changes(path, threshold=args.threshold)
+            exact_time += time.perf_counter() - t0
+            exact_results.append(scenes[1:])
+
+        truth_recall = np.mean([recall(r, t, args.tolerance) for r, (_, t) in zip(exact_results, videos)])
+        print(f"exact detector: {exact_time:.2f}s, recall vs ground truth {truth_recall:.3f}")
+        print(f"{'step':>5} {'seconds':>9} {'speedup':>8} {'recall':>7}")
+
+        for step in args.steps:
+            elapsed, recalls = 0.0, []
+            for (path, _), reference in zip(videos, exact_results):
+                t0 = time.perf_counter()
+                scenes = detect_scene_changes_fast(
+                    path, threshold=args.threshold, frame_step=step, resize_width=args.resize_width
+                )
+                elapsed += time.perf_counter() - t0
+                recalls.append(recall(scenes[1:], reference, args.tolerance))
+            print(f"{step:>5} {elapsed:>9.2f} {exact_time / elapsed:>7.1f}x {np.mean(recalls):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
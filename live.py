@@ -1,64 +1,69 @@
 import os
 import json
+import time
 from collections import Counter
 from datetime import datetime
 
 import cv2
 from PIL import Image
 
-from Captioning import predict_captions
-from Yolo import detect_objects_yolo
+from Captioning import predict_captions, enable_caption_cache, caption_cache_stats
+from Yolo import DetectionTracker
+from Sampling import ChangeDrivenSampler
+from FrameSource import open_source
 from LLMs import useCohere
+from ResultStore import ResultStore
 
 
-def find_working_camera(max_indexes: int = 5) -> int:
-    """Try common camera indices and return the first that works (cross‑platform)."""
-    for index in range(max_indexes):
-        cap = cv2.VideoCapture(index)
-        if cap.isOpened():
-            ret, _ = cap.read()
-            cap.release()
-            if ret:
-                print(f"✅ Camera found at index {index}")
-                return index
-    raise IOError("❌ No working camera found. Try plugging in a different webcam.")
+def live_caption_camera(batch_size: int = 4, target_fps: float = 15.0, source=None, sampler=None,
+                        max_batch_wait: float = 2.0):
+    """
+    Caption a live source in a window. source is a FrameSource.open_source spec
+    (default: FRAME_SOURCE env var, else the first working camera).
 
+    Frames are captioned when sampler (default ChangeDrivenSampler()) sees the detections
+    change; a partial batch is captioned once its oldest frame waited max_batch_wait seconds.
+    """
+    # Background grabbing: each loop iteration gets the newest frame, stale ones are dropped
+    source = open_source(source if source is not None else os.getenv("FRAME_SOURCE", "auto")).start()
 
-def live_caption_camera(every_n_frames: int = 10, batch_size: int = 4):
-    cam_index = find_working_camera()
-    cap = cv2.VideoCapture(cam_index)
-    if not cap.isOpened():
-        raise IOError("Cannot open camera")
-
-    frame_idx = 0
     imgs, meta_info = [], []
     captions_this_minute = {}
     last_minute = datetime.now().replace(second=0, microsecond=0)
     preds = []
+    # Full YOLO only every Kth frame, K chosen to hold target_fps on CPU
+    tracker = DetectionTracker(target_fps=target_fps)
+    sampler = sampler or ChangeDrivenSampler()
+    batch_started = None
+    results = ResultStore()
 
     os.makedirs("summaries", exist_ok=True)
+    enable_caption_cache()
     print("Live captioning started. Press 'q' to quit.")
 
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        grabbed = source.read(timeout=2.0)
+        if grabbed is None:
+            if source.ended:
+                print("Frame source ended.")
+                break
             print("Failed to read frame.")
-            break
+            continue
+        frame = grabbed.image
 
-        # YOLO detections (FIX: updated to new return signature)
-        raw_names, counts, annotated = detect_objects_yolo(frame)
+        # YOLO detections, boxes carried forward between full detections
+        det = tracker.update(frame)
+        counts, annotated = det.counts, det.annotated
 
-        if frame_idx % every_n_frames == 0 and counts:
+        if sampler.update(counts, det.names, det.boxes):
             pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             imgs.append(pil_img)
+            meta_info.append(counts)
+            batch_started = batch_started or time.monotonic()
 
-            # Build a stable "person: 3, car: 1" string
-            summary_str = ", ".join(f"{cls}: {cnt}" for cls, cnt in sorted(counts.items()))
-            meta_info.append(summary_str)
-
-        if len(imgs) >= batch_size:
+        if imgs and (len(imgs) >= batch_size or time.monotonic() - batch_started >= max_batch_wait):
             try:
-                preds = predict_captions(imgs, extra_info=meta_info)
+                preds = predict_captions(imgs, detections=meta_info)
                 # Aggregate captions by timestamp (per-minute)
                 timestamp = datetime.now().strftime("%H:%M:%S")
                 captions_this_minute.setdefault(timestamp, []).extend(preds)
@@ -67,6 +72,7 @@ def live_caption_camera(every_n_frames: int = 10, batch_size: int = 4):
                 preds = []
             imgs.clear()
             meta_info.clear()
+            batch_started = None
 
         if preds:
             # Draw the most recent caption on the frame
@@ -92,6 +98,9 @@ def live_caption_camera(every_n_frames: int = 10, batch_size: int = 4):
                 log_entry = {"time": last_minute.strftime("%Y-%m-%d %H:%M"), "summary": summary}
                 with open("summaries/live_summaries.json", "a", encoding="utf-8") as f:
                     f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+                # Also keep the captions behind the summary, queryable next to video results
+                results.add_live_summary(summary, captions_this_minute, source=source.name,
+                                         minute=log_entry["time"])
                 captions_this_minute = {}
                 last_minute = current_minute
             except Exception as e:
@@ -101,10 +110,12 @@ def live_caption_camera(every_n_frames: int = 10, batch_size: int = 4):
             print("👋 Quitting...")
             break
 
-        frame_idx += 1
-
-    cap.release()
+    source.stop()
     cv2.destroyAllWindows()
+    results.close()
+    print("Caption cache:", caption_cache_stats())
+    print("Frame source:", source.stats())
+    print("Caption sampler:", sampler.stats())
 
 
 if __name__ == "__main__":
@@ -1,10 +1,24 @@
+import functools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple
+
 import cv2
+import numpy as np
 from PIL import Image
 
 from Captioning import predict_captions
+from Metrics import stage_seconds_per_item, timed
 
 
-def caption_video(video_path: str, every_n_frames: int = 30, batch_size: int = 8):
+def caption_video(video_path: str, every_n_frames: int = 30, batch_size: int = 8, caption_fn=None):
+    """
+    Caption every every_n_frames-th frame. caption_fn(images) -> captions replaces
+    predict_captions (e.g. a shared CaptionScheduler's predict).
+    """
+    caption = caption_fn or functools.partial(predict_captions, max_batch_size=batch_size)
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise IOError(f"Cannot open video: {video_path}")
@@ -14,7 +28,8 @@ def caption_video(video_path: str, every_n_frames: int = 30, batch_size: int = 8
     frame_idx = 0
 
     while True:
-        ret, frame = cap.read()
+        with timed("decode"):
+            ret, frame = cap.read()
         if not ret:
             break
 
@@ -24,14 +39,14 @@ def caption_video(video_path: str, every_n_frames: int = 30, batch_size: int = 8
             idxs.append(frame_idx)
 
         if len(imgs) == batch_size:
-            preds = predict_captions(imgs)
+            preds = caption(imgs)
             captions.update(dict(zip(idxs, preds)))
             imgs, idxs = [], []
 
         frame_idx += 1
 
     if imgs:
-        preds = predict_captions(imgs)
+        preds = caption(imgs)
         captions.update(dict(zip(idxs, preds)))
 
     cap.release()
@@ -89,7 +104,8 @@ def caption_video_by_scenes(video_path, scene_frames, batch_size=8):
     scene_set = set(scene_frames)
 
     while True:
-        ret, frame = cap.read()
+        with timed("decode"):
+            ret, frame = cap.read()
         if not ret:
             break
 
@@ -99,48 +115,552 @@ def caption_video_by_scenes(video_path, scene_frames, batch_size=8):
             idxs.append(frame_idx)
 
         if len(imgs) == batch_size:
-            preds = predict_captions(imgs)
+            preds = predict_captions(imgs, max_batch_size=batch_size)
             captions.update(dict(zip(idxs, preds)))
             imgs, idxs = [], []
 
         frame_idx += 1
 
     if imgs:
-        preds = predict_captions(imgs)
+        preds = predict_captions(imgs, max_batch_size=batch_size)
         captions.update(dict(zip(idxs, preds)))
 
     cap.release()
     return captions
 
 
-def detect_scene_changes(video_path, threshold=0.5):
+def _scene_histogram(frame):
+    """Normalized 50x60 hue/saturation histogram used for scene-change scoring."""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [50, 60], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def probe_video(video_path):
+    """(frame_count, fps) from the container metadata without decoding; either may be 0."""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise IOError(f"Cannot open video: {video_path}")
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0), float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+    finally:
+        cap.release()
 
-    scenes = [0]
+
+def _iter_frame_scores(video_path, progress=None, progress_every=30):
+    """
+    Decode the video once and yield (frame_idx, frame, hist, diff) for every frame, where
+    diff is the Bhattacharyya distance to the previous frame's histogram (None for frame 0).
+
+    progress, if given, is called as progress(frames_decoded, frames_total) every
+    progress_every frames and once at the end.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
     prev_hist = None
     frame_idx = 0
 
-    while True:
-        ret, frame = cap.read()
+    try:
+        while True:
+            with timed("decode"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+
+            hist = _scene_histogram(frame)
+            diff = None
+            if prev_hist is not None:
+                diff = cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+            yield frame_idx, frame, hist, diff
+
+            prev_hist = hist
+            frame_idx += 1
+            if progress and frame_idx % progress_every == 0:
+                progress(frame_idx, total)
+
+        if progress:
+            progress(frame_idx, frame_idx)
+    finally:
+        cap.release()
+
+
+def iter_scene_keyframes(video_path, threshold=0.5, progress=None, progress_every=30):
+    """
+    Decode the video once and yield (frame_idx, frame) for the first frame of every scene.
+    A new scene starts where the Bhattacharyya distance between consecutive frame
+    histograms exceeds threshold; frame 0 always starts a scene.
+    """
+    for frame_idx, frame, _, diff in _iter_frame_scores(video_path, progress, progress_every):
+        if diff is None or diff > threshold:
+            yield frame_idx, frame
+
+
+def detect_scene_changes(video_path, threshold=0.5, fast=False, frame_step=4, resize_width=160, workers=0):
+    """
+    Frame indices where a new scene starts (always including 0).
+
+    fast=True switches to detect_scene_changes_fast, which scores downscaled frames and
+    only every frame_step-th frame; threshold has the same meaning in both modes.
+    workers > 1 splits the exact detector across that many processes (scan_video_parallel).
+    """
+    if workers and workers > 1:
+        return scan_video_parallel(video_path, threshold, workers=workers).scenes
+    if fast:
+        return detect_scene_changes_fast(video_path, threshold, frame_step, resize_width)
+    scenes = [frame_idx for frame_idx, _ in iter_scene_keyframes(video_path, threshold)]
+    return scenes or [0]
+
+
+def _downscaled_histogram(frame, resize_width):
+    """_scene_histogram on a copy of the frame shrunk to at most resize_width pixels wide."""
+    h, w = frame.shape[:2]
+    if resize_width and w > resize_width:
+        new_h = max(1, round(h * resize_width / w))
+        frame = cv2.resize(frame, (resize_width, new_h), interpolation=cv2.INTER_AREA)
+    return _scene_histogram(frame)
+
+
+def _bhattacharyya_rows(a, b):
+    """Row-wise cv2.HISTCMP_BHATTACHARYYA between two (N, bins) histogram arrays."""
+    a = a.astype(np.float64, copy=False)
+    b = b.astype(np.float64, copy=False)
+    bc = np.sqrt(a * b).sum(axis=1)
+    norm = np.sqrt(a.sum(axis=1) * b.sum(axis=1))
+    # OpenCV skips the normalisation for (near-)empty histograms
+    safe = norm > np.finfo(np.float32).eps
+    ratio = np.where(safe, bc / np.where(safe, norm, 1.0), bc)
+    return np.sqrt(np.clip(1.0 - ratio, 0.0, None))
+
+
+def _refine_cuts(cap, start, end, threshold, resize_width):
+    """Decode frames start..end and return the indices in (start, end] that begin a new scene."""
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    hists = []
+    for _ in range(end - start + 1):
+        with timed("decode"):
+            ret, frame = cap.read()
         if not ret:
             break
+        hists.append(_downscaled_histogram(frame, resize_width))
 
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        hist = cv2.calcHist([hsv], [0, 1], None, [50, 60], [0, 180, 0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
+    if len(hists) < 2:
+        return []
 
-        if prev_hist is not None:
-            diff = cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
-            if diff > threshold:
-                scenes.append(frame_idx)
+    hists = np.stack(hists)
+    diffs = _bhattacharyya_rows(hists[:-1], hists[1:])
+    return [start + 1 + int(i) for i in np.flatnonzero(diffs > threshold)]
 
-        prev_hist = hist
-        frame_idx += 1
 
-    cap.release()
-    return scenes
+def detect_scene_changes_fast(video_path, threshold=0.5, frame_step=4, resize_width=160):
+    """
+    Faster approximation of detect_scene_changes.
+
+    Only every frame_step-th frame is decoded (the others are skipped with cap.grab())
+    and histograms are computed on frames downscaled to resize_width. Distances between
+    sampled frames are computed in one NumPy pass; where one exceeds threshold, the
+    frames between the two samples are decoded to locate the exact cut frame.
+    """
+    frame_step = max(1, int(frame_step))
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+
+    try:
+        sampled, hists = [], []
+        frame_idx = 0
+        while True:
+            if frame_idx % frame_step == 0:
+                with timed("decode"):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                sampled.append(frame_idx)
+                hists.append(_downscaled_histogram(frame, resize_width))
+            elif not cap.grab():
+                break
+            frame_idx += 1
+
+        if len(hists) < 2 and frame_idx <= 1:
+            return [0]
+
+        windows = []
+        if len(hists) >= 2:
+            diffs = _bhattacharyya_rows(np.stack(hists[:-1]), np.stack(hists[1:]))
+            windows = [(sampled[i], sampled[i + 1]) for i in np.flatnonzero(diffs > threshold)]
+
+        if frame_step == 1:
+            return [0] + [end for _, end in windows]
+
+        # Frames after the last sample were never scored; check them too
+        last_frame = frame_idx - 1
+        if sampled and last_frame > sampled[-1]:
+            windows.append((sampled[-1], last_frame))
+
+        scenes = [0]
+        for start, end in windows:
+            scenes.extend(_refine_cuts(cap, start, end, threshold, resize_width))
+        return scenes
+    finally:
+        cap.release()
+
+
+def caption_video_single_pass(video_path, threshold=0.5, max_scenes=None, batch_size=8, progress=None,
+                              on_captions=None):
+    """
+    Scene detection and captioning in one decode of the video.
+
+    Keyframes are captioned in batches as soon as they are found instead of
+    re-reading the file after detection. Only the first max_scenes keyframes are
+    captioned (all when None), but every scene boundary is still reported.
+
+    progress is forwarded to iter_scene_keyframes; on_captions(frame_idxs, captions) is
+    called after every captioned batch so callers can stream results.
+
+    Returns (scenes, captions) where captions maps frame index -> caption.
+    """
+    scenes = []
+    captions = {}
+    imgs, idxs = [], []
+
+    for frame_idx, frame in iter_scene_keyframes(video_path, threshold, progress=progress):
+        scenes.append(frame_idx)
+        if max_scenes is not None and len(scenes) > max_scenes:
+            continue
+
+        imgs.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        idxs.append(frame_idx)
+
+        if len(imgs) == batch_size:
+            preds = predict_captions(imgs, max_batch_size=batch_size)
+            captions.update(dict(zip(idxs, preds)))
+            if on_captions:
+                on_captions(idxs, preds)
+            imgs, idxs = [], []
+
+    if imgs:
+        preds = predict_captions(imgs, max_batch_size=batch_size)
+        captions.update(dict(zip(idxs, preds)))
+        if on_captions:
+            on_captions(idxs, preds)
+
+    return scenes, captions
+
+
+def keyframe_budget(max_keyframes=None, time_budget_s=None, seconds_per_caption=None, default=24):
+    """
+    Number of keyframes to caption. A time budget is converted using the measured
+    seconds per generated caption (Metrics), falling back to seconds_per_caption or 1.5s.
+    With both limits given the smaller wins.
+    """
+    budgets = []
+    if max_keyframes:
+        budgets.append(int(max_keyframes))
+    if time_budget_s:
+        per_caption = seconds_per_caption or stage_seconds_per_item("generate") or 1.5
+        budgets.append(int(time_budget_s / per_caption))
+    return max(1, min(budgets)) if budgets else default
+
+
+class KeyframeSelector:
+    """
+    Streaming keyframe selection under a fixed budget, spread across the whole video.
+
+    The timeline is cut into `budget` equal buckets (10 s buckets when the frame count is
+    unknown) and each bucket contributes at most one keyframe. Candidates are scene cuts,
+    scored by their cut strength, plus a few evenly spaced frames per bucket so shots
+    without cuts are covered. When a bucket closes, every candidate also gets a novelty
+    score: its histogram distance to the nearest keyframe already chosen. The pick
+    maximises strength + novelty_weight * novelty. Candidates closer than
+    duplicate_threshold to a chosen keyframe are dropped, so a bucket may yield nothing.
+    """
+
+    def __init__(self, budget, total_frames=0, fps=0.0, novelty_weight=0.5, duplicate_threshold=0.15,
+                 max_candidates=8):
+        self.budget = max(1, int(budget))
+        if total_frames > 0:
+            self.bucket_frames = max(1, math.ceil(total_frames / self.budget))
+        else:
+            self.bucket_frames = max(1, int((fps or 30.0) * 10))
+        self.sample_every = max(1, self.bucket_frames // 4)
+        self.novelty_weight = novelty_weight
+        self.duplicate_threshold = duplicate_threshold
+        self.max_candidates = max_candidates
+        self.duplicates_dropped = 0
+        self._bucket = 0
+        self._candidates = []  # (strength, frame_idx, hist, payload)
+        self._selected_hists = []
+
+    @property
+    def selected(self) -> int:
+        return len(self._selected_hists)
+
+    def wants(self, frame_idx, is_cut) -> bool:
+        """Whether offer() would consider this frame: scene cuts plus a sparse regular sample."""
+        return is_cut or frame_idx % self.sample_every == 0
+
+    def offer(self, frame_idx, strength, hist, payload):
+        """Add a candidate; returns [(frame_idx, payload)] picked from buckets that just closed."""
+        picks = []
+        bucket = frame_idx // self.bucket_frames
+        if bucket != self._bucket:
+            picks = self._close()
+            self._bucket = bucket
+
+        self._candidates.append((strength, frame_idx, np.asarray(hist, dtype=np.float32).ravel(), payload))
+        if len(self._candidates) > self.max_candidates:
+            weakest = min(range(len(self._candidates)), key=lambda i: self._candidates[i][0])
+            del self._candidates[weakest]
+        return picks
+
+    def finish(self):
+        """Pick from the last open bucket."""
+        return self._close()
+
+    def _close(self):
+        candidates, self._candidates = self._candidates, []
+        if not candidates or self.selected >= self.budget:
+            return []
+
+        if self._selected_hists:
+            selected = np.stack(self._selected_hists)
+            novelty = np.array([
+                _bhattacharyya_rows(np.broadcast_to(c[2], selected.shape), selected).min()
+                for c in candidates
+            ])
+        else:
+            novelty = np.ones(len(candidates))
+
+        scores = np.array([c[0] for c in candidates]) + self.novelty_weight * novelty
+        scores[novelty < self.duplicate_threshold] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            self.duplicates_dropped += 1
+            return []
+
+        strength, frame_idx, hist, payload = candidates[best]
+        self._selected_hists.append(hist)
+        return [(frame_idx, payload)]
+
+
+def caption_video_budgeted(video_path, max_keyframes=24, threshold=0.5, batch_size=8, progress=None,
+                           on_captions=None, novelty_weight=0.5, duplicate_threshold=0.15, on_keyframes=None,
+                           caption_fn=None):
+    """
+    Single-decode scene detection plus captioning of at most max_keyframes keyframes
+    chosen by KeyframeSelector across the full timeline. on_captions(frame_idxs, captions)
+    and on_keyframes(frame_idxs, images, captions) are called after each caption batch;
+    caption_fn(images) -> captions replaces predict_captions.
+
+    Returns (scenes, captions) like caption_video_single_pass; scenes lists every cut.
+    """
+    total_frames, fps = probe_video(video_path)
+    selector = KeyframeSelector(
+        max_keyframes, total_frames, fps,
+        novelty_weight=novelty_weight, duplicate_threshold=duplicate_threshold
+    )
+
+    scenes = []
+    captions = {}
+    imgs, idxs = [], []
+
+    caption = caption_fn or functools.partial(predict_captions, max_batch_size=batch_size)
+
+    def caption_batch():
+        preds = caption(imgs)
+        captions.update(dict(zip(idxs, preds)))
+        if on_captions:
+            on_captions(list(idxs), preds)
+        if on_keyframes:
+            on_keyframes(list(idxs), list(imgs), preds)
+        imgs.clear()
+        idxs.clear()
+
+    def take(picks):
+        for frame_idx, frame in picks:
+            imgs.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+            idxs.append(frame_idx)
+            if len(imgs) == batch_size:
+                caption_batch()
+
+    for frame_idx, frame, hist, diff in _iter_frame_scores(video_path, progress):
+        is_cut = diff is None or diff > threshold
+        if is_cut:
+            scenes.append(frame_idx)
+        if selector.wants(frame_idx, is_cut):
+            strength = 1.0 if diff is None else (diff if is_cut else 0.0)
+            take(selector.offer(frame_idx, strength, hist, frame))
+
+    take(selector.finish())
+    if imgs:
+        caption_batch()
+
+    if selector.duplicates_dropped:
+        print(f"Dropped {selector.duplicates_dropped} near-duplicate keyframes")
+    return scenes, captions
+
+
+def split_frame_ranges(total_frames: int, chunks: int):
+    """[(start, end), ...] covering 0..total_frames in at most `chunks` near-equal ranges."""
+    chunks = max(1, min(int(chunks), total_frames))
+    bounds = [round(i * total_frames / chunks) for i in range(chunks + 1)]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+class VideoScan(NamedTuple):
+    scenes: List[int]                  # scene start frames, always including 0
+    strengths: Dict[int, float]        # cut frame -> histogram distance to the previous frame
+    detections: Dict[int, dict]        # frame -> {class: count} for the frames YOLO ran on
+    keyframes: Dict[int, np.ndarray]   # scene start frame -> BGR frame (keep_keyframes=True)
+    frames: int                        # frames decoded
+
+
+def _init_scan_worker():
+    # Parallelism comes from the process pool; nested thread pools would oversubscribe the cores
+    cv2.setNumThreads(1)
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+
+def _scan_range(video_path, start, end, threshold, detect_every=0, keep_keyframes=False, conf=0.25):
+    """
+    Worker: decode frames start..end-1, score scene cuts and optionally run YOLO.
+
+    The worker seeks to start-1 and decodes that frame too, so a cut exactly at a chunk
+    edge is scored against the true previous frame and found by the chunk that owns it.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+
+    cuts, keyframes, detections = [], {}, {}
+    pending, pending_idxs = [], []
+
+    def flush():
+        if not pending:
+            return
+        from Yolo import detect_batch
+
+        for idx, det in zip(pending_idxs, detect_batch(pending, conf=conf, annotate=False)):
+            detections[idx] = dict(det.counts)
+        pending.clear()
+        pending_idxs.clear()
+
+    try:
+        if detect_every:
+            import torch
+
+            torch.set_num_threads(1)
+
+        prev_hist = None
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start - 1)
+            ret, frame = cap.read()
+            if ret:
+                prev_hist = _scene_histogram(frame)
+
+        frame_idx = start
+        while frame_idx < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            hist = _scene_histogram(frame)
+            diff = None if prev_hist is None else cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+            if frame_idx == 0 or (diff is not None and diff > threshold):
+                cuts.append((frame_idx, 1.0 if diff is None else float(diff)))
+                if keep_keyframes:
+                    # JPEG keeps the result small on its way back through the pipe
+                    keyframes[frame_idx] = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+                if detect_every:
+                    pending.append(frame)
+                    pending_idxs.append(frame_idx)
+            elif detect_every and frame_idx % detect_every == 0:
+                pending.append(frame)
+                pending_idxs.append(frame_idx)
+            if len(pending) >= 8:
+                flush()
+
+            prev_hist = hist
+            frame_idx += 1
+        flush()
+    finally:
+        cap.release()
+
+    return {"start": start, "frames": frame_idx - start, "cuts": cuts, "keyframes": keyframes,
+            "detections": detections}
+
+
+def scan_video_parallel(video_path, threshold=0.5, workers=None, chunks_per_worker=2, detect_every=0,
+                        keep_keyframes=False, progress=None) -> VideoScan:
+    """
+    Exact scene detection (same result as detect_scene_changes) with decoding and scoring
+    split across worker processes by frame range. With detect_every > 0 the workers also
+    run YOLO on every scene start and every detect_every-th frame.
+
+    Each worker takes chunks_per_worker ranges on average so a slow range doesn't leave
+    the others idle. Workers use the spawn start method (safe with torch and OpenCV);
+    callers running this from a script need the usual `if __name__ == "__main__":` guard.
+    """
+    total, _ = probe_video(video_path)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    if total <= 0:
+        # Unknown length (some streams/containers): one worker decodes it all
+        ranges = [(0, 2 ** 62)]
+    else:
+        ranges = split_frame_ranges(total, workers * max(1, chunks_per_worker))
+        # CAP_PROP_FRAME_COUNT is a container estimate, often low for VFR files: the last
+        # range reads to the end of the stream so frames past the estimate are still scanned
+        ranges[-1] = (ranges[-1][0], 2 ** 62)
+
+    results, done = [], 0
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=ctx,
+                             initializer=_init_scan_worker) as pool:
+        futures = [
+            pool.submit(_scan_range, video_path, start, end, threshold, detect_every, keep_keyframes)
+            for start, end in ranges
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            done += result["frames"]
+            if progress:
+                progress(done, max(total, done))
+
+    results.sort(key=lambda r: r["start"])
+    strengths, detections, keyframes = {}, {}, {}
+    for result in results:
+        strengths.update(result["cuts"])
+        detections.update(result["detections"])
+        for idx, jpeg in result["keyframes"].items():
+            keyframes[idx] = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+
+    scenes = sorted(strengths) or [0]
+    return VideoScan(scenes, strengths, detections, keyframes, sum(r["frames"] for r in results))
+
+
+def caption_video_parallel(video_path, threshold=0.5, workers=None, batch_size=8, detect_every=30,
+                           max_scenes=None, progress=None):
+    """
+    Parallel scan (scan_video_parallel) followed by captioning of the scene keyframes in
+    this process; captions carry the YOLO counts of their frame.
+
+    Returns (scenes, captions) like caption_video_single_pass.
+    """
+    scan = scan_video_parallel(video_path, threshold, workers=workers, detect_every=detect_every,
+                               keep_keyframes=True, progress=progress)
+    idxs = [idx for idx in scan.scenes if idx in scan.keyframes][:max_scenes]
+
+    captions = {}
+    for i in range(0, len(idxs), batch_size):
+        batch = idxs[i:i + batch_size]
+        imgs = [Image.fromarray(cv2.cvtColor(scan.keyframes[idx], cv2.COLOR_BGR2RGB)) for idx in batch]
+        counts = [scan.detections.get(idx) for idx in batch]
+        preds = predict_captions(imgs, max_batch_size=batch_size, detections=counts)
+        captions.update(zip(batch, preds))
+    return scan.scenes, captions
 
 
 # if __name__ == "__main__":
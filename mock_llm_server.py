@@ -0,0 +1,61 @@
+"""
+Minimal OpenAI-compatible chat completions server for running the app offline.
+
+Answers with LLMs.extractive_summary of the prompt's "- " bullet lines, optionally after
+an artificial delay, so the "openai" LLM backend can be exercised without a real model:
+
+    python mock_llm_server.py            # serves http://127.0.0.1:8001/v1
+    LLM_BACKEND=openai python backend/main1.py
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI
+
+from LLMs import _estimate_tokens, extractive_summary
+
+MOCK_LLM_PORT = int(os.getenv("MOCK_LLM_PORT", "8001"))
+MOCK_LLM_LATENCY = float(os.getenv("MOCK_LLM_LATENCY_MS", "0")) / 1000
+
+app = FastAPI(title="Mock LLM")
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "local", "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    max_tokens = int(body.get("max_tokens") or 120)
+    if MOCK_LLM_LATENCY:
+        await asyncio.sleep(MOCK_LLM_LATENCY)
+
+    bullets = [line[2:] for line in prompt.splitlines() if line.startswith("- ")]
+    text = extractive_summary(bullets, max_tokens) or "No content to summarize."
+    prompt_tokens = _estimate_tokens(prompt)
+    completion_tokens = _estimate_tokens(text)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "local"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=MOCK_LLM_PORT)
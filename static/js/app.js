@@ -6,6 +6,10 @@ class VisionCaptioningApp {
         this.websocket = null;
         this.isProcessing = false;
         this.liveSummaries = [];
+        this.latestCaption = '';
+        this.latestObjects = [];
+        this.frameUrl = null;
+        this.textDecoder = new TextDecoder();
 
         this.initializeEventListeners();
         this.initializeDragAndDrop();
@@ -226,11 +230,13 @@ class VisionCaptioningApp {
         try {
             this.isProcessing = true;
             this.liveSummaries = []; // Reset summaries
+            this.latestCaption = '';
             this.showLoading('Starting camera...');
 
             // Connect WebSocket
             const wsProtocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
             this.websocket = new WebSocket(`${wsProtocol}//${location.host}/ws/camera`);
+            this.websocket.binaryType = 'arraybuffer';
 
             this.websocket.onopen = () => {
                 this.hideLoading();
@@ -247,11 +253,16 @@ class VisionCaptioningApp {
 
                 this.showToast('Camera started successfully!', 'success');
 
-                // Start the camera feed
-                this.websocket.send(JSON.stringify({ action: 'start' }));
+                // Start the camera feed, asking for raw JPEG frames instead of base64 JSON
+                this.websocket.send(JSON.stringify({ action: 'start', protocol: 'binary' }));
             };
 
             this.websocket.onmessage = (event) => {
+                if (event.data instanceof ArrayBuffer) {
+                    this.handleBinaryFrame(event.data);
+                    return;
+                }
+
                 const data = JSON.parse(event.data);
 
                 if (data.error) {
@@ -271,10 +282,22 @@ class VisionCaptioningApp {
                     this.showToast(`Live summary generated from ${data.caption_count} captions!`, 'info');
                 }
 
+                // Captions arrive asynchronously, separate from frames
+                if (data.type === 'caption') {
+                    this.latestCaption = data.caption;
+                }
+
+                // Binary mode: detections come on the JSON channel, only when they change
+                if (data.type === 'detections') {
+                    this.latestObjects = data.objects || [];
+                    return;
+                }
+
                 // Update camera feed
                 if (data.frame) {
                     const feed = document.getElementById('camera-feed');
                     if (feed) feed.src = data.frame;
+                    this.ackFrame(data.frame_count);
                 }
 
                 // Update results with both current data and summaries
@@ -298,6 +321,35 @@ class VisionCaptioningApp {
         }
     }
 
+    // Binary frame: [uint32 header length][JSON header][JPEG bytes]
+    handleBinaryFrame(buffer) {
+        const headerLength = new DataView(buffer).getUint32(0);
+        const header = JSON.parse(this.textDecoder.decode(new Uint8Array(buffer, 4, headerLength)));
+        const jpeg = new Blob([new Uint8Array(buffer, 4 + headerLength)], { type: 'image/jpeg' });
+
+        const feed = document.getElementById('camera-feed');
+        if (feed) {
+            const previousUrl = this.frameUrl;
+            this.frameUrl = URL.createObjectURL(jpeg);
+            feed.src = this.frameUrl;
+            if (previousUrl) URL.revokeObjectURL(previousUrl);
+        }
+        this.ackFrame(header.frame_count);
+
+        this.displayCameraResults({
+            objects: this.latestObjects,
+            frame_count: header.frame_count,
+            total_captions: header.total_captions,
+            stream: header.stream
+        });
+    }
+
+    // Lets the server measure round-trip time and adapt frame rate / quality
+    ackFrame(frameCount) {
+        if (frameCount === undefined || !this.websocket || this.websocket.readyState !== WebSocket.OPEN) return;
+        this.websocket.send(JSON.stringify({ action: 'ack', frame_count: frameCount }));
+    }
+
     stopCamera() {
         if (this.websocket) {
             try {
@@ -308,6 +360,11 @@ class VisionCaptioningApp {
             this.websocket.close();
             this.websocket = null;
         }
+        if (this.frameUrl) {
+            URL.revokeObjectURL(this.frameUrl);
+            this.frameUrl = null;
+        }
+        this.latestObjects = [];
 
         const startBtn = document.getElementById('start-camera');
         const stopBtn = document.getElementById('stop-camera');
@@ -346,11 +403,11 @@ class VisionCaptioningApp {
         }
 
         // Show current caption
-        if (data.caption) {
+        if (this.latestCaption) {
             content += `
                 <div class="caption-result">
                     <h6><i class="fas fa-video"></i> Latest Caption</h6>
-                    <p>${data.caption}</p>
+                    <p>${this.latestCaption}</p>
                 </div>
             `;
         }
@@ -377,6 +434,7 @@ class VisionCaptioningApp {
                         <i class="fas fa-chart-line"></i> 
                         Total captions: ${data.total_captions} | 
                         Summaries: ${this.liveSummaries.length}
+                        ${data.stream ? ` | ${data.stream.fps} fps, q${data.stream.quality}, ${Math.round(data.stream.scale * 100)}%` : ''}
                     </small>
                 </div>
             `;
@@ -412,7 +470,13 @@ class VisionCaptioningApp {
             });
 
             console.log('Upload response status:', response.status);
-            const result = await response.json();
+            const upload = await response.json();
+            if (!upload.success) {
+                throw new Error(upload.error || 'Upload failed');
+            }
+
+            this.showLoading('Video uploaded. Processing...');
+            const result = await this.streamVideoJob(upload.job_id);
             console.log('Upload result:', result);
 
             if (result.success) {
@@ -437,22 +501,117 @@ class VisionCaptioningApp {
         if (zone) zone.style.display = 'none';
         if (processing) processing.style.display = 'block';
 
-        // Simulate progress
         const progressBar = document.querySelector('.glass-progress');
-        let progress = 0;
-        const interval = setInterval(() => {
-            progress += Math.random() * 10;
-            if (progress > 85) progress = 85; // Don't go to 100% until done
-            if (progressBar) progressBar.style.width = `${progress}%`;
-        }, 2000);
-
-        this.progressInterval = interval;
+        if (progressBar) progressBar.style.width = '0%';
     }
 
-    hideVideoProcessing() {
-        if (this.progressInterval) {
-            clearInterval(this.progressInterval);
+    // Follow the job over server-sent events, rendering captions and partial summaries
+    // as they arrive; falls back to polling if the event stream cannot be used
+    streamVideoJob(jobId) {
+        if (!window.EventSource) return this.waitForVideoJob(jobId);
+
+        return new Promise((resolve, reject) => {
+            const progressBar = document.querySelector('.glass-progress');
+            const partial = { captions: [], summary: null };
+            const source = new EventSource(`/api/jobs/${jobId}/events`);
+            let finished = false;
+
+            source.addEventListener('progress', (e) => {
+                const p = JSON.parse(e.data);
+                if (p.frames_total && progressBar) {
+                    progressBar.style.width = `${Math.min(99, 100 * p.frames_processed / p.frames_total)}%`;
+                }
+                this.showLoading(`Processing video... ${p.frames_processed} / ${p.frames_total} frames`);
+            });
+
+            source.addEventListener('caption', (e) => {
+                partial.captions.push(JSON.parse(e.data));
+                this.displayPartialVideoResults(partial);
+            });
+
+            source.addEventListener('partial_summary', (e) => {
+                partial.summary = JSON.parse(e.data);
+                this.displayPartialVideoResults(partial);
+            });
+
+            source.addEventListener('done', (e) => {
+                finished = true;
+                source.close();
+                resolve(JSON.parse(e.data));
+            });
+
+            source.addEventListener('failed', (e) => {
+                finished = true;
+                source.close();
+                reject(new Error(`Video processing error: ${JSON.parse(e.data).error}`));
+            });
+
+            source.onerror = () => {
+                if (finished) return;
+                source.close();
+                this.waitForVideoJob(jobId).then(resolve, reject);
+            };
+        });
+    }
+
+    displayPartialVideoResults(partial) {
+        const resultsContent = document.getElementById('results-content');
+        if (!resultsContent) return;
+
+        let content = '';
+        if (partial.summary) {
+            content += `
+                <div class="summary-section mb-3">
+                    <h6><i class="fas fa-film"></i> Summary so far</h6>
+                    <div class="summary-box p-3" style="background: rgba(27, 54, 93, 0.1); border-left: 4px solid var(--kaust-blue); border-radius: 8px;">
+                        <p><strong>${partial.summary.summary}</strong></p>
+                    </div>
+                    <small class="text-muted mt-2 d-block">
+                        <i class="fas fa-info-circle"></i> From the first ${partial.summary.caption_count} captions
+                    </small>
+                </div>
+            `;
         }
+
+        const latest = partial.captions.slice(-5).reverse();
+        content += `
+            <div class="caption-result">
+                <h6><i class="fas fa-list"></i> Captions (${partial.captions.length} so far)</h6>
+                ${latest.map(c => `
+                    <div class="caption-item mb-2 p-2" style="background: rgba(0, 167, 157, 0.05); border-radius: 6px;">
+                        <small class="text-muted"><i class="fas fa-play-circle"></i> Frame ${c.frame}:</small><br>
+                        ${c.caption}
+                    </div>
+                `).join('')}
+            </div>
+        `;
+        resultsContent.innerHTML = content;
+    }
+
+    // Poll the job until it finishes, showing frames processed / total on the progress bar
+    async waitForVideoJob(jobId) {
+        const progressBar = document.querySelector('.glass-progress');
+        while (true) {
+            const statusResponse = await fetch(`/api/jobs/${jobId}`);
+            const status = await statusResponse.json();
+            if (!status.success) throw new Error(status.error || 'Job not found');
+
+            if (status.percent !== null && progressBar) {
+                progressBar.style.width = `${Math.min(status.percent, 99)}%`;
+            }
+            if (status.frames_total) {
+                this.showLoading(`Processing video... ${status.frames_processed} / ${status.frames_total} frames`);
+            }
+
+            if (status.status === 'done' || status.status === 'failed') {
+                const resultResponse = await fetch(`/api/jobs/${jobId}/result`);
+                return resultResponse.json();
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
+    hideVideoProcessing() {
         const progressBar = document.querySelector('.glass-progress');
         if (progressBar) progressBar.style.width = '100%';
         